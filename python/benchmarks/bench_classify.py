@@ -0,0 +1,70 @@
+"""
+Occupancy decisions per second of the region classifier against rendering
+the volume and thresholding its region means.
+
+Usage:
+    python benchmarks/bench_classify.py [--dim 44 68 44] [--frames 200]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cosbos import blockage, classify
+
+from synthetic import differenceMatrix
+
+def bestRate(func, n, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return n / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dim', type=int, nargs=3, default=[44, 68, 44])
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    dim = tuple(args.dim)
+    sensors, lights, sigma = classify.testbedGeometry(dim)
+    E_stack = np.stack([differenceMatrix(12, 12, seed=t) for t in range(args.frames)])
+    
+    t0 = time.perf_counter()
+    classifier = classify.RegionClassifier(sensors, lights, dim, sigma)
+    t_classifier = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma)
+    t_renderer = time.perf_counter() - t0
+    
+    # Render-then-threshold baseline: full volume, then region means
+    names = classifier.names
+    regions = classify.roomRegions(dim)
+    masks = np.stack([regions[name].reshape(-1, order='F') for name in names]).astype(np.float64)
+    masks /= masks.sum(axis=1, keepdims=True)
+    volume = np.empty(dim, order='F')
+    
+    def renderThenThreshold():
+        labels = []
+        for E in E_stack:
+            V = renderer.render(E, out=volume)
+            labels.append(classifier.decide(masks @ V.reshape(-1, order='F')))
+        return labels
+    
+    def classifyEach():
+        return [classifier.classify(E) for E in E_stack]
+    
+    assert renderThenThreshold() == classifyEach() == classifier.classify(E_stack)
+    
+    print('setup: renderer %.2f s, classifier %.2f s' % (t_renderer, t_classifier))
+    print('%-28s %16s' % ('method', 'decisions/s'))
+    for name, func in [('render then threshold', renderThenThreshold),
+                       ('classifier, per frame', classifyEach),
+                       ('classifier, batch', lambda: classifier.classify(E_stack))]:
+        print('%-28s %16.0f' % (name, bestRate(func, args.frames, args.repeat)))
+
+if __name__ == '__main__':
+    main()
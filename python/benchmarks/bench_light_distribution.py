@@ -0,0 +1,49 @@
+"""
+Microbenchmark of the fixture intensity lookup table against PCHIP.
+
+Usage:
+    python benchmarks/bench_light_distribution.py [--size 87 136] [--resolutions 0.5 0.1 0.05 0.01]
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+from cosbos import reflection
+
+def bestTime(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, nargs=2, default=[87, 136])
+    parser.add_argument('--resolutions', type=float, nargs='+', default=[0.5, 0.1, 0.05, 0.01])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    vivia = reflection.getFixtureProfile('vivia_7dr3_rgb')
+    theta = np.random.default_rng(0).uniform(0, np.pi / 2, size=args.size)
+    
+    # What lightDistribution did on every call before profiles existed
+    def pchipPerCall():
+        return PchipInterpolator(vivia.angles, vivia.intensity)(theta * 180 / np.pi)
+    
+    t_pchip = bestTime(pchipPerCall, args.repeat)
+    t_exact = bestTime(lambda: vivia.exact(theta), args.repeat)
+    print('%-28s %10s %10s %12s' % ('method', 'time (ms)', 'speedup', 'max error'))
+    print('%-28s %10.3f %10.2f %12s' % ('PCHIP built per call', 1e3 * t_pchip, 1.0, '-'))
+    print('%-28s %10.3f %10.2f %12.2e' % ('PCHIP cached', 1e3 * t_exact, t_pchip / t_exact, 0.0))
+    for resolution in args.resolutions:
+        profile = reflection.FixtureProfile(vivia.angles, vivia.intensity, resolution)
+        t = bestTime(lambda: profile(theta), args.repeat)
+        print('%-28s %10.3f %10.2f %12.2e' % ('table, %g deg' % resolution, 1e3 * t,
+                                              t_pchip / t, profile.maxError()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Throughput of batched multi-room LTM recovery against a Python loop.
+
+Usage:
+    python benchmarks/bench_ltm_batch.py [--rooms 500] [--l 48] [--m 36] [--N 40]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cosbos import ltm
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=500)
+    parser.add_argument('--l', type=int, default=48)
+    parser.add_argument('--m', type=int, default=36)
+    parser.add_argument('--N', type=int, default=40)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    Xs = rng.normal(size=(args.rooms, args.m, args.N))
+    Ys = rng.normal(size=(args.rooms, args.l, args.m)) @ Xs
+    
+    print('%-12s %12s %12s %10s' % ('solver', 'loop (r/s)', 'batch (r/s)', 'speedup'))
+    for name, single, batch in [
+            ('fullrank', ltm.solve_A_fullrank, ltm.solve_A_fullrank_batch),
+            ('Fnorm', ltm.solve_A_Fnorm, ltm.solve_A_Fnorm_batch)]:
+        t0 = time.perf_counter()
+        A_loop = np.stack([single(X, Y) for X, Y in zip(Xs, Ys)])
+        t_loop = time.perf_counter() - t0
+        
+        t0 = time.perf_counter()
+        A_batch = batch(Xs, Ys)
+        t_batch = time.perf_counter() - t0
+        
+        assert np.allclose(A_loop, A_batch, atol=1e-6)
+        print('%-12s %12.0f %12.0f %10.2f' % (name, args.rooms / t_loop, args.rooms / t_batch,
+                                             t_loop / t_batch))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Scaling of blockage hashing with the number of worker threads.
+
+Usage:
+    python benchmarks/bench_parallel.py [--dim 87 136 88] [--workers 1 2 4 8 16]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cosbos import blockage
+
+from synthetic import testbedGeometry
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dim', type=int, nargs=3, default=[44, 68, 44])
+    parser.add_argument('--sigma', type=float, default=20.0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    sensors, lights = testbedGeometry(args.dim)
+    
+    H_serial = blockage.hashGaussians(sensors, lights, args.dim, args.sigma)
+    
+    print('%8s %10s %8s %10s' % ('workers', 'time (s)', 'speedup', 'identical'))
+    base = None
+    for n_jobs in args.workers:
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            H = blockage.hashGaussians(sensors, lights, args.dim, args.sigma, n_jobs=n_jobs)
+            times.append(time.perf_counter() - t0)
+        best = min(times)
+        base = best if base is None else base
+        print('%8d %10.3f %8.2f %10s' % (n_jobs, best, base / best, np.array_equal(H, H_serial)))
+
+if __name__ == '__main__':
+    main()
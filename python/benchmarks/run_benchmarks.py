@@ -0,0 +1,250 @@
+"""
+Speed and memory benchmarks of the blockage, reflection and LTM hot paths.
+
+Every benchmark runs over a grid of problem sizes (grid resolution, number of
+sensors and lights, number of perturbations) on synthetic geometry, and
+records the best and median wall time, the peak of tracemalloc-traced memory
+of one call, and the peak RSS of the process so far. Results go to a JSON
+report that can be compared against an earlier one.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--quick] [--filter hash] [--output report.json]
+    python benchmarks/run_benchmarks.py --compare baseline.json [--fail-above 0.2]
+"""
+import argparse
+import fnmatch
+import importlib.metadata
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+from cosbos import blockage, ltm, reflection
+
+from synthetic import differenceMatrix, ltmProblem, occupiedDifferenceMatrix, roomGeometry
+
+_BENCHMARKS = []
+
+def benchmark(name, **params):
+    """
+    Register setup(**params) as benchmark name over the cartesian product of
+    the params lists. setup returns the zero-argument function to time.
+    """
+    def register(setup):
+        _BENCHMARKS.append((name, params, setup))
+        return setup
+    return register
+
+def _sigma(dim):
+    # sigma = 20 inches on the 87 x 136 x 88 testbed grid
+    return 20.0 * dim[0] / 87
+
+GRIDS = [(22, 34, 22), (44, 68, 44), (87, 136, 88)]
+# The dense H of the full testbed grid with 24 x 24 lines alone is 4.8 GB, so
+# the cases that form H stop at the half-resolution grid. At sigma = 20
+# inches a cutoff of 4 sigma keeps most of H, so this includes the tube
+# case. The coarse-to-fine renderer never forms H and runs on all grids.
+DENSE_GRIDS = GRIDS[:2]
+LTM_SIZES = [(48, 36), (96, 72)]
+
+@benchmark('blockage.hashGaussians', dim=DENSE_GRIDS, ns=[12, 24], nl=[12, 24])
+def hashGaussians(dim, ns, nl):
+    sensors, lights = roomGeometry(dim, ns, nl)
+    return lambda: blockage.hashGaussians(sensors, lights, dim, _sigma(dim))
+
+@benchmark('blockage.hashGaussians[tube]', dim=DENSE_GRIDS, ns=[12, 24], nl=[12, 24])
+def hashGaussiansTube(dim, ns, nl):
+    sensors, lights = roomGeometry(dim, ns, nl)
+    return lambda: blockage.hashGaussians(sensors, lights, dim, _sigma(dim), cutoff=4,
+                                          method='tube')
+
+@benchmark('blockage.volumeFromHashing', dim=DENSE_GRIDS, ns=[12, 24], nl=[12, 24])
+def volumeFromHashing(dim, ns, nl):
+    sensors, lights = roomGeometry(dim, ns, nl)
+    H = blockage.hashGaussians(sensors, lights, dim, _sigma(dim))
+    E = differenceMatrix(ns, nl)
+    return lambda: blockage.volumeFromHashing(sensors, lights, dim, H, E)
+
+@benchmark('blockage.BlockageRenderer.render', dim=DENSE_GRIDS, ns=[12, 24], nl=[12, 24])
+def render(dim, ns, nl):
+    sensors, lights = roomGeometry(dim, ns, nl)
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, _sigma(dim))
+    E = differenceMatrix(ns, nl)
+    return lambda: renderer.render(E)
+
+@benchmark('blockage.BlockageRenderer.render[floor]', dim=DENSE_GRIDS, ns=[12, 24], nl=[12, 24])
+def renderFloor(dim, ns, nl):
+    sensors, lights = roomGeometry(dim, ns, nl)
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, _sigma(dim), projection='floor')
+    E = differenceMatrix(ns, nl)
+    return lambda: renderer.render(E)
+
+@benchmark('blockage.CoarseToFineRenderer.render', dim=GRIDS, factors=[(4,), (8, 2)])
+def renderCoarseToFine(dim, factors):
+    # One object in a corner of the room, so most blocks stay coarse
+    sensors, lights = roomGeometry(dim, 12, 12)
+    renderer = blockage.CoarseToFineRenderer(sensors, lights, dim, _sigma(dim), factors=factors,
+                                             threshold=0.3)
+    E = occupiedDifferenceMatrix(sensors, lights, 0.2 * np.asarray(dim), 0.05 * dim[0])
+    return lambda: renderer.render(E)
+
+@benchmark('reflection.getReflectionKernel', dim=GRIDS)
+def getReflectionKernel(dim):
+    sensors, lights = roomGeometry(dim, 1, 1)
+    return lambda: reflection.getReflectionKernel(lights[0], sensors[0], dim, 1)
+
+@benchmark('reflection.getReflectionKernels', dim=GRIDS, ns=[12, 24], nl=[12, 24])
+def getReflectionKernels(dim, ns, nl):
+    sensors, lights = roomGeometry(dim, ns, nl)
+    return lambda: reflection.getReflectionKernels(lights, sensors, dim, 1)
+
+@benchmark('ltm.solve_A_fullrank', size=LTM_SIZES, N=[40, 80])
+def solveFullrank(size, N):
+    X, Y, _ = ltmProblem(*size, N)
+    return lambda: ltm.solve_A_fullrank(X, Y)
+
+@benchmark('ltm.solve_A_Fnorm', size=LTM_SIZES, N=[40, 80])
+def solveFnorm(size, N):
+    X, Y, _ = ltmProblem(*size, N)
+    return lambda: ltm.solve_A_Fnorm(X, Y)
+
+@benchmark('ltm.solve_A_0norm', size=LTM_SIZES, N=[20, 40])
+def solve0norm(size, N):
+    X, Y, _ = ltmProblem(*size, N)
+    return lambda: ltm.solve_A_0norm(X, Y)
+
+@benchmark('ltm.solve_A_1norm', size=LTM_SIZES[:1], N=[20, 40])
+def solve1norm(size, N):
+    X, Y, _ = ltmProblem(*size, N)
+    return lambda: ltm.solve_A_1norm(X, Y)
+
+def cases(quick=False, pattern='*'):
+    """
+    (name, params, setup) of every registered benchmark and size. With
+    quick, only the smallest size of each benchmark.
+    """
+    for name, params, setup in _BENCHMARKS:
+        if not fnmatch.fnmatch(name, pattern) and pattern not in name:
+            continue
+        keys = list(params)
+        grids = [params[key][:1] if quick else params[key] for key in keys]
+        for values in itertools.product(*grids):
+            yield name, dict(zip(keys, values)), setup
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    Time func at least repeat times and for at least min_time seconds, then
+    trace the memory of one more call.
+
+    Returns:
+        result: dict of time_min, time_median, n_runs and peak_traced_bytes
+    """
+    func()  # warm up caches and lazy imports
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'time_min': min(times), 'time_median': float(np.median(times)),
+            'n_runs': len(times), 'peak_traced_bytes': peak}
+
+def _maxRSS():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def _gitRevision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata():
+    try:
+        version = importlib.metadata.version('cosbos')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    return {'cosbos': version, 'git': _gitRevision(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def _key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+def compare(results, baseline, fail_above):
+    """
+    Print the time ratio of every benchmark found in both reports.
+
+    Returns:
+        regressions: number of benchmarks slower than baseline by more than
+            the fraction fail_above
+    """
+    previous = {_key(result): result for result in baseline['results']}
+    regressions = 0
+    print('\n%-34s %-44s %10s' % ('benchmark', 'params', 'ratio'))
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        ratio = result['time_min'] / old['time_min']
+        flag = ''
+        if ratio > 1 + fail_above:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('%-34s %-44s %10.2f%s' % (result['name'], _key(result)[1], ratio, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='smallest size of each benchmark only')
+    parser.add_argument('--filter', default='*', help='glob or substring of benchmark names')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='JSON report to compare against')
+    parser.add_argument('--fail-above', type=float, default=0.2,
+                        help='exit with an error if a benchmark is this fraction slower')
+    args = parser.parse_args()
+
+    results = []
+    print('%-34s %-44s %10s %10s %12s %10s' % ('benchmark', 'params', 'min (ms)', 'med (ms)',
+                                              'traced (MB)', 'RSS (MB)'))
+    for name, params, setup in cases(args.quick, args.filter):
+        result = measure(setup(**params), args.repeat, args.min_time)
+        result.update(name=name, params=params, max_rss_bytes=_maxRSS())
+        results.append(result)
+        print('%-34s %-44s %10.3f %10.3f %12.1f %10.1f' % (
+            name, json.dumps(params), 1e3 * result['time_min'], 1e3 * result['time_median'],
+            result['peak_traced_bytes'] / 2**20, result['max_rss_bytes'] / 2**20))
+
+    report = {'metadata': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.fail_above):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
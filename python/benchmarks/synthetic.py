@@ -0,0 +1,88 @@
+"""
+Synthetic room geometries and LTM problems for the benchmarks, so they run
+without the .mat data.
+"""
+import numpy as np
+
+from cosbos.blockage import pointToLineDistance
+from cosbos.classify import TESTBED_DIM as ROOM, TESTBED_LIGHTS as LIGHTS, TESTBED_SENSORS as SENSORS
+
+def testbedGeometry(dim):
+    """
+    Sensors and lights of the testbed, scaled to a [dim_x, dim_y, dim_z] grid.
+    """
+    scale = np.asarray(dim) / np.asarray(ROOM)
+    return SENSORS * scale, LIGHTS * scale
+
+def roomGeometry(dim, ns, nl, seed=0):
+    """
+    A room like the testbed with any number of sensors and lights: sensors
+    on the two long walls at random heights below the middle of the room,
+    lights on a jittered grid on the ceiling.
+
+    Args:
+        dim: [dim_x, dim_y, dim_z]
+        ns: number of sensors
+        nl: number of lights
+
+    Returns:
+        sensors: [ns, 3]
+        lights: [nl, 3]
+    """
+    rng = np.random.default_rng(seed)
+    dx, dy, dz = (float(d) for d in dim)
+
+    sensors = np.empty((ns, 3))
+    sensors[:, 0] = np.where(np.arange(ns) % 2 == 0, 0.0, dx - 1)
+    sensors[:, 1] = rng.uniform(0.1 * dy, 0.9 * dy, size=ns)
+    sensors[:, 2] = rng.uniform(0.2 * dz, 0.5 * dz, size=ns)
+
+    cols = int(np.ceil(np.sqrt(nl * dx / dy)))
+    rows = int(np.ceil(nl / cols))
+    gx, gy = np.meshgrid((np.arange(cols) + 0.5) / cols, (np.arange(rows) + 0.5) / rows)
+    lights = np.empty((nl, 3))
+    lights[:, 0] = gx.ravel()[:nl] * dx
+    lights[:, 1] = gy.ravel()[:nl] * dy
+    lights[:, :2] += rng.uniform(-1, 1, size=(nl, 2))
+    lights[:, 2] = 0.98 * dz
+    return sensors, lights
+
+def differenceMatrix(ns, nl, seed=0):
+    """
+    Random non-negative E = A0 - A of shape [4*ns, 3*nl].
+    """
+    return np.random.default_rng(seed).uniform(size=(4 * ns, 3 * nl))
+
+def occupiedDifferenceMatrix(sensors, lights, point, radius):
+    """
+    E = A0 - A of one object of the given radius at point: each line is
+    blocked in proportion to a Gaussian of its distance to the point.
+    """
+    ns, nl = len(sensors), len(lights)
+    starts = np.tile(sensors, (nl, 1))
+    ends = np.repeat(lights, ns, axis=0)
+    d = pointToLineDistance(np.asarray([point], dtype=np.float64), starts, ends)[0]
+    weights = np.exp(-d**2 / (2 * radius**2)).reshape((nl, ns)).T
+    E = np.zeros((4 * ns, 3 * nl))
+    for k in range(3):
+        E[k::4, k::3] = weights / 3
+    return E
+
+def ltmProblem(l, m, N, density=0.2, seed=0):
+    """
+    Noiseless measurements Y = A X with a sparse non-negative LTM A.
+
+    Args:
+        l: number of sensor channels (rows of A)
+        m: number of light channels (columns of A)
+        N: number of perturbations
+
+    Returns:
+        X: [m, N]
+        Y: [l, N]
+        A: [l, m]
+    """
+    rng = np.random.default_rng(seed)
+    A = rng.uniform(size=(l, m)) * (rng.uniform(size=(l, m)) < density)
+    X = rng.uniform(-1, 1, size=(m, N))
+    return X, A @ X, A
@@ -1,5 +1,10 @@
 from . import ltm
 from . import blockage
 from . import reflection
+from . import cache
+from . import pipeline
+from . import io
+from . import instrument
+from . import classify
 
-__all__ = ["ltm", "blockage", "reflection"]
+__all__ = ["ltm", "blockage", "reflection", "cache", "pipeline", "io", "instrument", "classify"]
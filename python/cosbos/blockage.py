@@ -1,179 +1,415 @@
+import concurrent.futures
+import functools
+import os
+
 import numpy as np
+import scipy.sparse
+
+from . import instrument
 
-def pointToLineDistance(x, y, z, x1, y1, z1, x2, y2, z2):
+def _lineDistanceSquared(P_x, P_y, P_z, S, D, out, segment=False):
     """
-    Vectorized calculation of distance from points (x,y,z) to line segments.
-    x, y, z can be arrays (broadcast against each other).
-    x1...z2 are scalars (or arrays broadcasts against each other).
+    Squared distances from points to lines, written into out.
     
-    Returns: distances squared (to avoid sqrt) or distances?
-    The C++ implementation returns distances.
+    The arithmetic is that of the distance computation of hashGaussians.cpp,
+    operation for operation, but fused through out= so that only two
+    temporaries of the size of the output are alive.
+    
+    Args:
+        P_x, P_y, P_z: [B] point coordinates
+        S: [3, L] start of each line
+        D: [3, L] direction (end - start) of each line
+        out: [B, L] float64 array
+        segment: clamp to the segment instead of the infinite line
+        
+    Returns:
+        out
     """
-    x3 = x2 - x1
-    y3 = y2 - y1
-    z3 = z2 - z1
+    # Points as [B, 1] columns and lines as [1, L] rows
+    P = (P_x[:, np.newaxis], P_y[:, np.newaxis], P_z[:, np.newaxis])
+    S = [S[k][np.newaxis, :] for k in range(3)]
+    D = [D[k][np.newaxis, :] for k in range(3)]
     
-    segmentLenSq = x3**2 + y3**2 + z3**2
+    seg_len_sq = D[0]**2 + D[1]**2 + D[2]**2
     
-    # Avoid division by zero
-    # If segmentLenSq is 0, just distance to point 1
-    # We can handle this by using where
+    # Avoid div by 0 for zero length segments (though unlikely for sensors/lights)
+    seg_len_sq[seg_len_sq == 0] = 1e-10
     
-    # Vectorized alpha calculation
-    # alpha = ((x - x1) * x3 + (y - y1) * y3 + (z - z1) * z3) / segmentLenSq
+    order = 'F' if out.flags.f_contiguous and not out.flags.c_contiguous else 'C'
+    t = np.empty(out.shape, order=order)
+    tmp = np.empty(out.shape, order=order)
     
-    # We need to execute this across all voxels AND all lines.
-    # Let's say voxels are shape (D,), lines are shape (L,)
-    # We can reshape x to (D, 1) and x1 to (1, L).
-    pass 
+    # t = (v . d) / |d|^2 with v = P - S
+    for k in range(3):
+        np.subtract(P[k], S[k], out=tmp)
+        if k == 0:
+            np.multiply(tmp, D[k], out=t)
+        else:
+            tmp *= D[k]
+            t += tmp
+    t /= seg_len_sq
+    if segment:
+        np.clip(t, 0, 1, out=t)
+    
+    # |P - (S + t d)|^2
+    for k in range(3):
+        np.multiply(t, D[k], out=tmp)
+        tmp += S[k]
+        np.subtract(P[k], tmp, out=tmp)
+        if k == 0:
+            np.multiply(tmp, tmp, out=out)
+        else:
+            tmp *= tmp
+            out += tmp
+    return out
 
-def hashGaussians(sensors, lights, dim, sigma):
+def pointToLineDistance(points, starts, ends, segment=False, squared=False, out=None,
+                        block_size=None):
     """
-    Python implementation of hashGaussians.cpp
+    Distances from points to lines, as in hashGaussians.cpp.
+    
+    The C++ code computes an `onSegment` flag but never uses it, so the
+    blockage model uses distances to the infinite lines through the
+    endpoints (segment=False). segment=True clamps to the segments instead.
+    A zero length line gives the distance to its start.
     
     Args:
-        sensors: [N, 3] coordinates
-        lights: [M, 3] coordinates
-        dim: [dim_x, dim_y, dim_z]
-        sigma: scalar
-        
+        points: [P, 3] coordinates
+        starts: [L, 3] start of each line
+        ends: [L, 3] end of each line
+        segment: distances to the segments rather than to the infinite lines
+        squared: return squared distances, skipping the square root
+        out: optional [P, L] float64 array to write the distances into
+        block_size: optional number of points per block, which bounds the
+            two internal temporaries to [block_size, L]
+            
     Returns:
-        H: [prod(dim) * N * M] flat array
+        dist: [P, L] distances (out, if given)
     """
-    ns = sensors.shape[0]
-    nl = lights.shape[0]
+    points = np.asarray(points)
+    starts = np.asarray(starts, dtype=np.float64)
+    S = starts.T
+    D = np.asarray(ends, dtype=np.float64).T - S
     
-    # 1. Generate voxel coordinates
-    # C++ loop order:
-    # for i = 0 to dimProd
-    #   x = i % dim[0]
-    #   y = (i / dim[0]) % dim[1]
-    #   z = i / (dim[0] * dim[1])
-    # This corresponds to 'F' (Fortran) order flattening if we had [dim_x, dim_y, dim_z]
-    # ACTUALLY:
-    # x is inner-most in C++ loop logic above IF a=i is constructed that way
-    # Wait, the C++ code says:
-    # int x = a % dim[0]; a /= dim[0];
-    # int y = a % dim[1]; 
-    # int z = a / dim[1];
-    # This means x changes fastest. This is consistent with Fortran order (column-major)
-    # in a 3D array arr[x, y, z].
+    num_points = points.shape[0]
+    if out is None:
+        out = np.empty((num_points, S.shape[1]))
+    elif out.shape != (num_points, S.shape[1]) or out.dtype != np.float64:
+        raise ValueError("out must be a float64 array of shape %s" % ((num_points, S.shape[1]),))
     
-    nx, ny, nz = int(dim[0]), int(dim[1]), int(dim[2])
+    block = num_points if block_size is None else max(int(block_size), 1)
+    for start in range(0, num_points, block):
+        stop = min(start + block, num_points)
+        pts = points[start:stop]
+        _lineDistanceSquared(pts[:, 0], pts[:, 1], pts[:, 2], S, D, out[start:stop], segment)
+    
+    if not squared:
+        np.sqrt(out, out=out)
+    return out
+
+# Number of [block, ns*nl] float64 arrays alive at once while evaluating one
+# block of voxels in _gaussianBlock: the output and the two temporaries of
+# _lineDistanceSquared. Used to turn a memory budget in bytes into a block size.
+_TEMPORARIES_PER_ENTRY = 3
+
+def _voxelCoordinates(dim, start, stop):
+    """
+    Coordinates of the voxels with flat indices [start, stop).
+    
+    Matches the C++ loop order:
+        x = i % dim[0]
+        y = (i / dim[0]) % dim[1]
+        z = i / (dim[0] * dim[1])
+    so x changes fastest, i.e. Fortran (column-major) order of an
+    array arr[x, y, z].
+    
+    Returns:
+        pts_x, pts_y, pts_z: [stop - start] integer arrays
+    """
+    nx, ny = int(dim[0]), int(dim[1])
+    idx = np.arange(start, stop)
+    return idx % nx, (idx // nx) % ny, idx // (nx * ny)
+
+def _lineEndpoints(sensors, lights):
+    """
+    Sensor-light line segments in the C++ hashing order.
+    
+    The C++ loop iterates j over ns*nl with s = j % ns and l = j / ns, so the
+    sensor index changes fastest.
     
-    # Create grid. Using 'ij' means x varies with first index, which is what we want?
-    # np.meshgrid with 'ij' gives X[i,j,k] = i.
-    # If we flatten 'F', x changes fastest.
-    grid_x, grid_y, grid_z = np.meshgrid(
-        np.arange(nx), np.arange(ny), np.arange(nz), indexing='ij'
-    )
-    
-    # Flatten to list of points
-    # shape: [num_voxels]
-    pts_x = grid_x.flatten('F')
-    pts_y = grid_y.flatten('F')
-    pts_z = grid_z.flatten('F')
-    
-    num_voxels = pts_x.shape[0]
-    
-    # 2. Prepare line segments
-    # The C++ loop iterates j over ns*nl
-    # s = j % ns; l = j / ns;
-    # So s changes fastest.
-    # This corresponds to repeating sensors nl times and tiling lights ns times?
-    # No.
-    # j=0: s=0, l=0
-    # j=1: s=1, l=0
-    # ...
-    # j=ns: s=0, l=1
-    
-    # Sensors: repeat nl times (outer loop is l)
-    # Lights: repeat each element ns times (inner loop is s)
-    # Actually, let's just make arrays of shape [ns*nl]
+    Returns:
+        S: [3, ns*nl] sensor end of each line
+        D: [3, ns*nl] direction (light - sensor) of each line
+    """
+    ns = sensors.shape[0]
+    nl = lights.shape[0]
     
     s_idx = np.tile(np.arange(ns), nl)
     l_idx = np.repeat(np.arange(nl), ns)
     
-    sx = sensors[s_idx, 0]
-    sy = sensors[s_idx, 1]
-    sz = sensors[s_idx, 2]
+    S = np.asarray(sensors, dtype=np.float64)[s_idx].T
+    D = np.asarray(lights, dtype=np.float64)[l_idx].T - S
+    return S, D
+
+def _gaussianBlock(pts, S, D, sigma, out=None):
+    """
+    Gaussian weights of a block of voxels w.r.t. every line.
     
-    lx = lights[l_idx, 0]
-    ly = lights[l_idx, 1]
-    lz = lights[l_idx, 2]
+    The C++ code computes an `onSegment` flag but never uses it: `res.d` is
+    built from the unclamped alpha, so the Gaussian is based on the distance
+    to the INFINITE line through sensor and light. We follow that exactly.
     
-    # 3. Calculate distances
-    # We want result of shape [num_voxels, ns*nl]
-    # Reshape pts to [num_voxels, 1]
-    # Reshape lines to [1, ns*nl]
+    Args:
+        pts: tuple (pts_x, pts_y, pts_z) of [B] voxel coordinates
+        S: [3, L] sensor end of each line
+        D: [3, L] direction of each line
+        sigma: scalar
+        out: optional [B, L] float64 array to write the weights into
+        
+    Returns:
+        H_block: [B, L] array (out, if given)
+    """
+    if out is None:
+        out = np.empty((pts[0].shape[0], S.shape[1]))
+    _lineDistanceSquared(pts[0], pts[1], pts[2], S, D, out)
     
-    P_x = pts_x[:, np.newaxis]
-    P_y = pts_y[:, np.newaxis]
-    P_z = pts_z[:, np.newaxis]
+    invTwoSigmaSq = 1.0 / (2.0 * sigma * sigma)
+    out *= -invTwoSigmaSq
+    return np.exp(out, out=out)
+
+def _numJobs(n_jobs):
+    """
+    Number of worker threads for n_jobs (None: 1, negative: all cores).
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() or 1, 1)
+    return max(int(n_jobs), 1)
+
+def _parallelMap(func, items, n_jobs):
+    """
+    list(map(func, items)), run on a thread pool when n_jobs > 1.
     
-    S_x = sx[np.newaxis, :]
-    S_y = sy[np.newaxis, :]
-    S_z = sz[np.newaxis, :]
+    The heavy lifting in func is done by NumPy, which releases the GIL, so
+    threads scale without copying arrays to other processes.
+    """
+    if n_jobs <= 1:
+        return [func(item) for item in items]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(func, items))
+
+def _blockSize(dim, num_lines, max_memory, n_jobs=1):
+    """
+    Number of voxels per block.
     
-    L_x = lx[np.newaxis, :]
-    L_y = ly[np.newaxis, :]
-    L_z = lz[np.newaxis, :]
+    Blocks are whole z-slabs (multiples of dim_x * dim_y voxels, contiguous
+    in the Fortran layout) where possible. With several jobs, the grid is
+    split into about 4 blocks per job for load balancing, and max_memory is
+    shared between the blocks being processed at the same time. The
+    temporaries of one block stay within its share (at least one voxel per
+    block).
+    """
+    num_voxels = max(int(np.prod(dim)), 1)
+    slab = max(int(dim[0]) * int(dim[1]), 1)
     
-    dx = L_x - S_x
-    dy = L_y - S_y
-    dz = L_z - S_z
+    block = num_voxels
+    if n_jobs > 1:
+        block = slab * max(-(-int(dim[2]) // (4 * n_jobs)), 1)
     
-    seg_len_sq = dx**2 + dy**2 + dz**2
+    if max_memory is not None:
+        bytes_per_voxel = _TEMPORARIES_PER_ENTRY * 8 * max(num_lines, 1)
+        budget = max(max_memory // (bytes_per_voxel * n_jobs), 1)
+        if budget >= slab:
+            budget -= budget % slab
+        block = min(block, budget)
     
-    # Avoid div by 0 for zero length segments (though unlikely for sensors/lights)
-    seg_len_sq[seg_len_sq == 0] = 1e-10
+    return int(min(block, num_voxels))
+
+def _tubeVoxels(dim, s, d, radius):
+    """
+    Voxels that may lie within radius of the infinite line s + t*d.
     
-    # Vector from sensor to point
-    vx = P_x - S_x
-    vy = P_y - S_y
-    vz = P_z - S_z
-    
-    t = (vx * dx + vy * dy + vz * dz) / seg_len_sq
-    
-    # Clamp t to segment [0, 1]
-    # The C++ code checks: if (alpha >= 0.0 && alpha <= 1.0) onSegment=true
-    # Else it projects to line?
-    # Wait, the C++ code:
-    # double xv = x1 - x + alpha * x3; 
-    # This is vector from P to Projection Point.
-    # x1 + alpha*x3 is the point on the LINE (infinite).
-    # So the C++ code calculates distance to the INFINITE line defined by the segment
-    # regardless of whether it falls on the segment or not.
-    # WAIT! 
-    # The struct has `bool onSegment`.
-    # But `res.d` is calculated using `xv, yv, zv` which uses `alpha` directly without clamping.
-    # So `res.d` is distance to the infinite line.
-    # AND `H` uses `res.d` directly!
-    # H[i...] = exp(-res.d * res.d * ...);
-    # So the `onSegment` flag is computed but NEVER USED in `generateGaussian`.
-    # This implies the Gaussian is based on distance to the infinite line passing through sensor and light.
-    # This is a bit surprising for a specific "segment", but that matches the C++ code.
-    # I will strictly follow the C++ code logic.
-    
-    closest_x = S_x + t * dx
-    closest_y = S_y + t * dy
-    closest_z = S_z + t * dz
-    
-    dist_sq = (P_x - closest_x)**2 + (P_y - closest_y)**2 + (P_z - closest_z)**2
+    The line is walked one voxel slice at a time along the axis on which it
+    advances fastest. In each slice, the points within radius of the line
+    form an ellipse around the crossing point, and its bounding box is
+    enumerated. The cost is proportional to the volume of the tube rather
+    than to the whole grid.
     
-    invTwoSigmaSq = 1.0 / (2.0 * sigma * sigma)
-    H_mat = np.exp(-dist_sq * invTwoSigmaSq)
+    Args:
+        dim: [dim_x, dim_y, dim_z]
+        s: [3] point on the line
+        d: [3] direction of the line
+        radius: scalar
+        
+    Returns:
+        pts_x, pts_y, pts_z: integer coordinates of the candidate voxels
+    """
+    dim = [int(n) for n in dim]
+    
+    if not np.any(d):
+        # Zero length segment: distances are taken to the point s
+        ranges = [np.arange(max(int(np.ceil(s[k] - radius)), 0),
+                            min(int(np.floor(s[k] + radius)), dim[k] - 1) + 1)
+                  for k in range(3)]
+        grid = np.meshgrid(*ranges, indexing='ij')
+        return tuple(g.ravel() for g in grid)
+    
+    main = int(np.argmax(np.abs(d)))
+    a, b = [k for k in range(3) if k != main]
+    
+    # Crossing point of the line with each slice along the main axis
+    c = np.arange(dim[main])
+    t = (c - s[main]) / d[main]
+    
+    coords = [None, None, None]
+    coords[main] = c[:, np.newaxis, np.newaxis]
+    for k, shape in ((a, (1, -1, 1)), (b, (1, 1, -1))):
+        # Half extent of the ellipse along axis k
+        ext = radius * np.sqrt(1.0 + (d[k] / d[main])**2)
+        lo = np.ceil(s[k] + t * d[k] - ext).astype(np.int64)
+        offsets = np.arange(int(np.floor(2.0 * ext)) + 2).reshape(shape)
+        coords[k] = lo[:, np.newaxis, np.newaxis] + offsets
+    
+    coords = np.broadcast_arrays(*coords)
+    inside = np.ones(coords[0].shape, dtype=bool)
+    for k in (a, b):
+        inside &= (coords[k] >= 0) & (coords[k] < dim[k])
+    return tuple(coord[inside] for coord in coords)
+
+def _hashTube(dim, S, D, sigma, cutoff, n_jobs=1, dtype=np.float64):
+    """
+    The tube engine of hashGaussians: for each line, evaluate the Gaussian
+    only on the voxels within cutoff * sigma of it.
+    
+    Returns:
+        H: [num_voxels, num_lines] scipy.sparse CSC matrix
+    """
+    nx, ny = int(dim[0]), int(dim[1])
+    num_voxels = int(np.prod(dim))
+    num_lines = S.shape[1]
+    threshold = np.exp(-0.5 * cutoff * cutoff)
+    
+    def hashLine(j):
+        pts = _tubeVoxels(dim, S[:, j], D[:, j], cutoff * sigma)
+        H_line = _gaussianBlock(pts, S[:, j:j + 1], D[:, j:j + 1], sigma)[:, 0]
+        
+        keep = H_line >= threshold
+        rows = pts[0][keep] + nx * (pts[1][keep] + ny * pts[2][keep])
+        order = np.argsort(rows)
+        return rows[order], H_line[keep][order].astype(dtype, copy=False)
+    
+    columns = _parallelMap(hashLine, range(num_lines), n_jobs)
+    indices = [rows for rows, _ in columns]
+    data = [vals for _, vals in columns]
+    indptr = np.concatenate([[0], np.cumsum([rows.shape[0] for rows in indices])])
+    
+    return scipy.sparse.csc_matrix(
+        (np.concatenate(data), np.concatenate(indices), indptr),
+        shape=(num_voxels, num_lines))
+
+# Truncation radius (in units of sigma) of the tube engine when no cutoff is
+# given. Dropped weights are below exp(-6.5^2 / 2) ~ 7e-10.
+_TUBE_CUTOFF = 6.5
+
+def _geometrySizes(sensors, lights, dim, *args, **kwargs):
+    # Sizes recorded by the instrumented stages of this module
+    return {'voxels': int(np.prod(dim)), 'lines': sensors.shape[0] * lights.shape[0]}
+
+@instrument.profiled('blockage.hashGaussians', _geometrySizes)
+def hashGaussians(sensors, lights, dim, sigma, max_memory=None, cutoff=None,
+                  method='dense', n_jobs=None, dtype=np.float64):
+    """
+    Python implementation of hashGaussians.cpp
+    
+    Args:
+        sensors: [N, 3] coordinates
+        lights: [M, 3] coordinates
+        dim: [dim_x, dim_y, dim_z]
+        sigma: scalar
+        max_memory: optional budget in bytes for the temporaries of one block
+            of voxels. Voxels are processed in blocks small enough to fit it.
+            The output itself is not counted. None processes all voxels at once.
+        cutoff: optional truncation radius in units of sigma (e.g. 4). Weights
+            of voxels farther than cutoff * sigma from a line are dropped and
+            a sparse matrix is returned instead of the flat dense array.
+        method: 'dense' evaluates every voxel-line pair. 'tube' evaluates,
+            for each line, only the voxels within cutoff * sigma of it (6.5
+            sigma if no cutoff is given), at a cost proportional to the tube
+            volume. Without a cutoff, the result is still the flat dense
+            array, with weights outside the tube set to zero. max_memory
+            only applies to 'dense'.
+        n_jobs: number of worker threads (-1 for all cores). 'dense' splits
+            the grid into z-slabs and 'tube' splits the lines between them.
+            The result is bitwise identical to the serial one.
+        dtype: dtype of the returned weights. Distances and Gaussians are
+            evaluated in float64 one block at a time and rounded on store, so
+            np.float32 halves the memory of H with a relative error of at
+            most 2**-24 per weight.
+        
+    Returns:
+        H: [prod(dim) * N * M] flat array, or, if cutoff is given, a
+           scipy.sparse CSC matrix of shape [prod(dim), N * M]
+    """
+    ns = sensors.shape[0]
+    nl = lights.shape[0]
+    
+    num_voxels = int(np.prod(dim))
+    num_lines = ns * nl
+    
+    S, D = _lineEndpoints(sensors, lights)
+    n_jobs = _numJobs(n_jobs)
+    
+    if method == 'tube':
+        H = _hashTube(dim, S, D, sigma, _TUBE_CUTOFF if cutoff is None else cutoff, n_jobs, dtype)
+        if cutoff is not None:
+            return H
+        H_mat = np.zeros((num_voxels, num_lines), dtype=dtype, order='F')
+        for j in range(num_lines):
+            H_mat[H.indices[H.indptr[j]:H.indptr[j + 1]], j] = H.data[H.indptr[j]:H.indptr[j + 1]]
+        return H_mat.reshape(-1, order='F')
+    elif method != 'dense':
+        raise ValueError("method must be 'dense' or 'tube', got %r" % (method,))
+    
+    block = _blockSize(dim, num_lines, max_memory, n_jobs)
+    starts = range(0, num_voxels, block)
+    
+    if cutoff is not None:
+        # Keep weights with dist <= cutoff * sigma, i.e. H >= exp(-cutoff^2 / 2)
+        threshold = np.exp(-0.5 * cutoff * cutoff)
+        
+        def hashBlock(start):
+            stop = min(start + block, num_voxels)
+            H_block = _gaussianBlock(_voxelCoordinates(dim, start, stop), S, D, sigma)
+            r, c = np.nonzero(H_block >= threshold)
+            return r + start, c, H_block[r, c].astype(dtype, copy=False)
+        
+        blocks = _parallelMap(hashBlock, starts, n_jobs)
+        rows, cols, vals = (np.concatenate(parts) for parts in zip(*blocks))
+        return scipy.sparse.csc_matrix((vals, (rows, cols)), shape=(num_voxels, num_lines))
     
-    # Flatten H:
     # C++ indexing: H[i + dimProd * j]
-    # i is voxel index (fastest), j is line index (slowest)
-    # Our H_mat is [num_voxels, ns*nl]. Flattening Fortran style will put i first?
-    # No, 'F' means first dimension changes fastest.
-    # So H_mat.flatten('F') will iterate i (voxel) then j (line).
-    # Which matches H[i + dimProd * j].
+    # i is voxel index (fastest), j is line index (slowest).
+    # Filling a Fortran-ordered [num_voxels, ns*nl] matrix block by block and
+    # returning its Fortran-order flat view gives exactly that layout without
+    # the extra copy of flatten('F'). Blocks write disjoint rows, so workers
+    # can fill it concurrently.
+    H_mat = np.empty((num_voxels, num_lines), dtype=dtype, order='F')
     
-    return H_mat.flatten('F')
+    def hashBlock(start):
+        stop = min(start + block, num_voxels)
+        pts = _voxelCoordinates(dim, start, stop)
+        if H_mat.dtype == np.float64:
+            # Straight into the rows of H, with no block-sized copy
+            _gaussianBlock(pts, S, D, sigma, out=H_mat[start:stop, :])
+        else:
+            H_mat[start:stop, :] = _gaussianBlock(pts, S, D, sigma)
+    
+    _parallelMap(hashBlock, starts, n_jobs)
+    
+    return H_mat.reshape(-1, order='F')
 
+@instrument.profiled('blockage.volumeFromHashing', _geometrySizes)
 def volumeFromHashing(sensors, lights, dim, H, E):
     """
     Python implementation of volumeFromHashing.cpp
@@ -182,7 +418,9 @@ def volumeFromHashing(sensors, lights, dim, H, E):
         sensors: [N, 3]
         lights: [M, 3]
         dim: [3]
-        H: flattened H
+        H: flattened H, or the sparse [prod(dim), N * M] matrix returned by
+           hashGaussians with a cutoff. For a float32 H the matrix product is
+           done in float32 and the normalization sums in float64.
         E: flattened E (or matrix)? In C++ E is passed as double*.
            E corresponds to difference matrix A0 - A.
            In MATLAB, A is m2 x m1. m2 = 4*ns, m1=3*nl?
@@ -198,7 +436,7 @@ def volumeFromHashing(sensors, lights, dim, H, E):
            So E is (4*ns) x (3*nl).
            
     Returns:
-        V: [nx, ny, nz] volume
+        V: [nx, ny, nz] volume, of the dtype of H
     """
     ns = sensors.shape[0]
     nl = lights.shape[0]
@@ -229,18 +467,19 @@ def volumeFromHashing(sensors, lights, dim, H, E):
     # Since sc%4 can be 3, but lc%3 is only 0,1,2.
     # So we sum for rem=0, rem=1, rem=2.
     
-    for r in range(3):
-        # Select rows where sc%4 == r
-        rows = E_mat[r::4, :] # shape [ns, 3*nl]
-        
-        # Select cols where lc%3 == r
-        cols = rows[:, r::3] # shape [ns, nl]
-        
-        L += cols.flatten(order='F') # add to L (which is flat ns*nl)
-        # Wait, L is indexed L[s + l*ns].
-        # In flattened cols (F-order), indices are (s, l).
-        # s changes fastest. So index is s + l*ns.
-        # This matches.
+    with instrument.stage('blockage.volumeFromHashing.lineWeights', lines=ns * nl):
+        for r in range(3):
+            # Select rows where sc%4 == r
+            rows = E_mat[r::4, :] # shape [ns, 3*nl]
+            
+            # Select cols where lc%3 == r
+            cols = rows[:, r::3] # shape [ns, nl]
+            
+            L += cols.flatten(order='F') # add to L (which is flat ns*nl)
+            # Wait, L is indexed L[s + l*ns].
+            # In flattened cols (F-order), indices are (s, l).
+            # s changes fastest. So index is s + l*ns.
+            # This matches.
      
     # Now verify the loop condition: sc%4 == lc%3.
     # Matrix shape (4*ns, 3*nl).
@@ -257,16 +496,20 @@ def volumeFromHashing(sensors, lights, dim, H, E):
     
     dimProd = int(np.prod(dim))
     
-    H_mat = H.reshape((dimProd, ns * nl), order='F')
+    H_mat = _hashMatrix(H, dimProd, ns * nl)
     
-    numerator = H_mat @ L
+    # In the precision of H; a float32 H is never promoted to a float64 copy
+    with instrument.stage('blockage.volumeFromHashing.gemm', voxels=dimProd, lines=ns * nl):
+        numerator = H_mat @ L.astype(H_mat.dtype, copy=False)
     
-    denominator = np.sum(H_mat, axis=1)
+    # Sum of all Gaussians at each voxel, in float64 whatever the dtype of H.
+    # Use BlockageRenderer to normalize once for a stream of frames.
+    with instrument.stage('blockage.volumeFromHashing.denominator', voxels=dimProd):
+        denominator = _rowSums(H_mat)
     
-    # Handle division by zero
-    with np.errstate(divide='ignore', invalid='ignore'):
-        V_flat = numerator / denominator
-        V_flat[denominator == 0] = 0
+    # Handle division by zero. V has the dtype of H.
+    V_flat = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=V_flat, where=denominator != 0)
     
     # Reshape V to (nx, ny, nz)
     # C++ returns flat array, but MEX creates 3D array of dim.
@@ -274,3 +517,588 @@ def volumeFromHashing(sensors, lights, dim, H, E):
     V = V_flat.reshape((int(dim[0]), int(dim[1]), int(dim[2])), order='F')
     
     return V
+
+def _hashMatrix(H, dimProd, num_lines):
+    """
+    View of H as a [prod(dim), ns*nl] matrix.
+    
+    H is either the flat array of hashGaussians or its sparse matrix form.
+    """
+    if scipy.sparse.issparse(H):
+        return H
+    return H.reshape((dimProd, num_lines), order='F')
+
+def _rowSums(H_mat):
+    """
+    Float64 row sums of a dense or sparse [prod(dim), ns*nl] matrix.
+    """
+    if scipy.sparse.issparse(H_mat):
+        return np.asarray(H_mat.sum(axis=1, dtype=np.float64)).ravel()
+    return np.sum(H_mat, axis=1, dtype=np.float64)
+
+@functools.lru_cache(maxsize=16)
+def _lineWeightIndex(ns, nl):
+    """
+    Row and column indices into E of the entries summed into L.
+    
+    L[s + l*ns] = sum over r in 0..2 of E[4*s + r, 3*l + r]
+    
+    Returns:
+        rows, cols: [3, ns*nl] integer arrays
+    """
+    s_idx = np.tile(np.arange(ns), nl)
+    l_idx = np.repeat(np.arange(nl), ns)
+    r = np.arange(3)[:, np.newaxis]
+    rows = 4 * s_idx[np.newaxis, :] + r
+    cols = 3 * l_idx[np.newaxis, :] + r
+    rows.flags.writeable = False
+    cols.flags.writeable = False
+    return rows, cols
+
+def lineWeights(E, ns, nl):
+    """
+    Aggregate the difference matrix E into one weight per sensor-light line.
+    
+    This is the construction of L in volumeFromHashing.cpp: for each sensor s
+    and light l, the diagonal of the top 3x3 sub-block of the 4x3 block of E.
+    
+    Args:
+        E: [4*ns, 3*nl] matrix, its column-major flat form, or a stack
+           [T, 4*ns, 3*nl] of matrices
+        ns: number of sensors
+        nl: number of lights
+        
+    Returns:
+        L: [ns*nl] weights, or [T, ns*nl] for a stack
+    """
+    E = np.asarray(E)
+    if E.ndim == 1:
+        E = E.reshape((4 * ns, 3 * nl), order='F')
+    rows, cols = _lineWeightIndex(ns, nl)
+    return E[..., rows, cols].sum(axis=-2)
+
+@instrument.profiled('blockage.volumesFromHashing', _geometrySizes)
+def volumesFromHashing(sensors, lights, dim, H, E):
+    """
+    Batched volumeFromHashing for a stream of difference matrices.
+    
+    All frames are rendered with one matrix product against the stacked line
+    weights. The normalization denominator is recomputed on every call; use
+    BlockageRenderer to normalize H once for successive batches.
+    
+    Args:
+        sensors: [N, 3]
+        lights: [M, 3]
+        dim: [3]
+        H: flattened H, or the sparse [prod(dim), N * M] matrix returned by
+           hashGaussians with a cutoff
+        E: [T, 4*N, 3*M] stack of difference matrices E = A0 - A
+        
+    Returns:
+        V: [T, nx, ny, nz] volumes
+    """
+    ns = sensors.shape[0]
+    nl = lights.shape[0]
+    nx, ny, nz = int(dim[0]), int(dim[1]), int(dim[2])
+    dimProd = nx * ny * nz
+    
+    H_mat = _hashMatrix(H, dimProd, ns * nl)
+    L = lineWeights(E, ns, nl).astype(H_mat.dtype, copy=False) # [T, ns*nl]
+    T = L.shape[0]
+    
+    denominator = _rowSums(H_mat)
+    
+    # [T, dimProd] with each row a volume in Fortran order
+    if scipy.sparse.issparse(H_mat):
+        numerator = np.ascontiguousarray((H_mat @ L.T).T)
+    else:
+        numerator = L @ H_mat.T
+    
+    V_flat = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=V_flat, where=denominator != 0)
+    
+    # Row t reshaped in Fortran order to (nx, ny, nz) is the C-order
+    # (nz, ny, nx) array transposed, so this is a view.
+    return V_flat.reshape((T, nz, ny, nx)).transpose(0, 3, 2, 1)
+
+def _projectionMatrix(dim, projection):
+    """
+    Sparse matrix summing the voxels of a volume into the outputs of a
+    projection.
+    
+    Args:
+        dim: (nx, ny, nz)
+        projection: 'floor' for the sum over z, as sum(V, 3) in
+            demo_Blockage.m, or region masks (boolean or weights) of shape
+            [n_regions, nx, ny] (floor regions, all heights) or
+            [n_regions, nx, ny, nz]
+        
+    Returns:
+        R: [n_out, prod(dim)] CSC matrix
+        output_shape: (nx, ny) or (n_regions,)
+    """
+    nx, ny, nz = dim
+    num_voxels = nx * ny * nz
+    if isinstance(projection, str):
+        if projection != 'floor':
+            raise ValueError("projection must be 'floor' or region masks, got %r" % (projection,))
+        # Voxel i = x + nx*y + nx*ny*z goes to floor cell x + nx*y
+        cols = np.arange(num_voxels)
+        R = scipy.sparse.csc_matrix((np.ones(num_voxels), (cols % (nx * ny), cols)),
+                                    shape=(nx * ny, num_voxels))
+        return R, (nx, ny)
+    
+    masks = np.asarray(projection, dtype=np.float64)
+    if masks.ndim == 3 and masks.shape[1:] == (nx, ny):
+        masks = np.broadcast_to(masks[..., np.newaxis], masks.shape + (nz,))
+    elif masks.shape[1:] != (nx, ny, nz):
+        raise ValueError("region masks must have shape [n_regions, %d, %d] or "
+                         "[n_regions, %d, %d, %d], got %s" % (nx, ny, nx, ny, nz, masks.shape))
+    n_regions = masks.shape[0]
+    # Voxels in Fortran order, as the rows of H
+    R = scipy.sparse.csc_matrix(masks.transpose(0, 3, 2, 1).reshape(n_regions, num_voxels))
+    return R, (n_regions,)
+
+def _projectedOperator(R, hashBlock, num_voxels, block, n_jobs):
+    """
+    R @ W for the row-normalized W = H / sum(H), accumulated one block of
+    voxels at a time so that W is never formed as a whole.
+    
+    Args:
+        R: [n_out, num_voxels] CSC matrix
+        hashBlock: function of (start, stop) returning the [stop - start,
+            ns*nl] rows of H
+        block: voxels per block
+        n_jobs: worker threads
+        
+    Returns:
+        P: [n_out, ns*nl] float64 array
+    """
+    def projectBlock(start):
+        stop = min(start + block, num_voxels)
+        W_block = np.array(hashBlock(start, stop), dtype=np.float64)
+        denominator = _rowSums(W_block)
+        inv = np.zeros_like(denominator)
+        np.divide(1.0, denominator, out=inv, where=denominator != 0)
+        W_block *= inv[:, np.newaxis]
+        return R[:, start:stop] @ W_block
+    
+    starts = list(range(0, num_voxels, block))
+    P = None
+    # n_jobs blocks at a time, so at most n_jobs partial results are alive
+    for i in range(0, len(starts), n_jobs):
+        for part in _parallelMap(projectBlock, starts[i:i + n_jobs], n_jobs):
+            if P is None:
+                P = part
+            else:
+                P += part
+    return np.asarray(P)
+
+class BlockageRenderer:
+    """
+    Reusable renderer of blockage volumes for a fixed room geometry.
+    
+    The row-normalized operator W = H / sum(H) is built once, so rendering a
+    frame is the extraction of the line weights L from E followed by a
+    single matrix-vector product V = W @ L. With the dense operator,
+    render() allocates nothing beyond the ns*nl line weights and the output
+    volume, and only the line weights when given out=. The renderer is not
+    modified by rendering, so one instance can be shared between threads
+    as long as they do not share out.
+    
+    With a projection, the operator is instead the [n_out, ns*nl] reduction
+    R @ W of W over z (floor maps) or over region masks. It is accumulated
+    one z-slab of voxels at a time, so neither W nor any volume is ever
+    formed, and each frame costs a GEMV of n_out rows instead of prod(dim).
+    
+    Args:
+        sensors: [N, 3] coordinates
+        lights: [M, 3] coordinates
+        dim: [dim_x, dim_y, dim_z]
+        sigma: scalar
+        dtype: storage dtype of the operator and of rendered volumes.
+            np.float32 halves memory and bandwidth. H is hashed in this dtype
+            and normalized with float64 row sums.
+        max_memory: passed to hashGaussians
+        cutoff: passed to hashGaussians. The operator is then sparse, and
+            render() needs one temporary of the size of the volume.
+        H: optional precomputed output of hashGaussians for this geometry
+           (e.g. from cosbos.cache.HashCache). It is not modified.
+        n_jobs: passed to hashGaussians. Rendering itself is a BLAS matrix
+            product and uses the BLAS thread pool.
+        projection: None to render volumes, 'floor' to render floor maps
+            [nx, ny] (the sum of the volume over z), or region masks of
+            shape [n_regions, nx, ny] or [n_regions, nx, ny, nz] to render
+            per-region scores [n_regions] (the mask-weighted sum of the
+            volume over each region)
+    
+    Attributes:
+        operator: [prod(dim), ns*nl] W, or the [n_out, ns*nl] projected operator
+        output_shape: shape of rendered outputs, dim or that of the projection
+    """
+    
+    @instrument.profiled('blockage.BlockageRenderer.build',
+                         lambda self, sensors, lights, dim, *args, **kwargs:
+                         _geometrySizes(sensors, lights, dim))
+    def __init__(self, sensors, lights, dim, sigma, dtype=np.float64,
+                 max_memory=None, cutoff=None, H=None, n_jobs=None, projection=None):
+        self.ns = sensors.shape[0]
+        self.nl = lights.shape[0]
+        self.dim = tuple(int(d) for d in dim)
+        self.sigma = sigma
+        self.dtype = np.dtype(dtype)
+        self.projection = projection
+        self.output_shape = self.dim
+        
+        dimProd = int(np.prod(self.dim))
+        num_lines = self.ns * self.nl
+        
+        if projection is not None:
+            self._buildProjection(sensors, lights, H, max_memory, cutoff, n_jobs)
+            return
+        
+        owned = H is None
+        if owned:
+            H = hashGaussians(sensors, lights, dim, sigma, max_memory=max_memory,
+                              cutoff=cutoff, n_jobs=n_jobs, dtype=self.dtype)
+        H_mat = _hashMatrix(H, dimProd, num_lines)
+        
+        denominator = _rowSums(H_mat)
+        inv = np.zeros_like(denominator)
+        np.divide(1.0, denominator, out=inv, where=denominator != 0)
+        
+        if scipy.sparse.issparse(H_mat):
+            self.operator = (scipy.sparse.diags(inv) @ H_mat).tocsr().astype(self.dtype)
+        else:
+            # Normalize in place when we own H, to avoid a copy
+            if owned and self.dtype == H_mat.dtype:
+                W = H_mat
+            else:
+                W = np.empty((dimProd, num_lines), dtype=self.dtype, order='F')
+            np.multiply(H_mat, inv[:, np.newaxis], out=W)
+            self.operator = W
+    
+    def _buildProjection(self, sensors, lights, H, max_memory, cutoff, n_jobs):
+        dimProd = int(np.prod(self.dim))
+        num_lines = self.ns * self.nl
+        n_jobs = _numJobs(n_jobs)
+        R, self.output_shape = _projectionMatrix(self.dim, self.projection)
+        
+        if H is None and cutoff is not None:
+            H = hashGaussians(sensors, lights, self.dim, self.sigma, max_memory=max_memory,
+                              cutoff=cutoff, n_jobs=n_jobs)
+        
+        if H is None:
+            S, D = _lineEndpoints(sensors, lights)
+            
+            def hashBlock(start, stop):
+                return _gaussianBlock(_voxelCoordinates(self.dim, start, stop), S, D, self.sigma)
+        else:
+            H_mat = _hashMatrix(H, dimProd, num_lines)
+            if scipy.sparse.issparse(H_mat):
+                H_mat = H_mat.tocsr()
+                
+                def hashBlock(start, stop):
+                    return H_mat[start:stop].toarray()
+            else:
+                def hashBlock(start, stop):
+                    return H_mat[start:stop]
+        
+        # Whole z-slabs unless max_memory asks for smaller blocks
+        block = _blockSize(self.dim, num_lines, max_memory, n_jobs)
+        block = min(block, self.dim[0] * self.dim[1])
+        P = _projectedOperator(R, hashBlock, dimProd, block, n_jobs)
+        self.operator = np.ascontiguousarray(P, dtype=self.dtype)
+    
+    @instrument.profiled('blockage.BlockageRenderer.render')
+    def render(self, E, out=None):
+        """
+        Render the volume for one difference matrix.
+        
+        Args:
+            E: [4*N, 3*M] difference matrix, or its column-major flat form
+            out: optional Fortran-ordered array of shape output_shape
+                 ([nx, ny, nz] without projection) and of the renderer's
+                 dtype to write the volume into
+            
+        Returns:
+            V: [nx, ny, nz] volume, or the projection of it (out, if given)
+        """
+        E = np.asarray(E)
+        if E.ndim == 1:
+            E = E.reshape((4 * self.ns, 3 * self.nl), order='F')
+        
+        # Sum of the diagonal of the top 3x3 sub-block of each 4x3 block,
+        # through strided views. L is allocated per call (it is only ns*nl
+        # long) so that concurrent renders do not share it.
+        L = np.empty(self.ns * self.nl, dtype=self.dtype)
+        L2d = L.reshape((self.nl, self.ns)) # L[s + l*ns] viewed as [nl, ns]
+        np.add(E[0::4, 0::3].T, E[1::4, 1::3].T, out=L2d)
+        np.add(L2d, E[2::4, 2::3].T, out=L2d)
+        
+        if out is None:
+            out = np.empty(self.output_shape, dtype=self.dtype, order='F')
+        elif (out.shape != self.output_shape or out.dtype != self.dtype
+              or not out.flags.f_contiguous):
+            raise ValueError("out must be a Fortran-ordered %s array of shape %s"
+                             % (self.dtype, self.output_shape))
+        
+        # Fortran-order flat view of out
+        V_flat = out.reshape(-1, order='F')
+        with instrument.stage('blockage.BlockageRenderer.render.gemm', voxels=V_flat.size,
+                              lines=L.size):
+            if scipy.sparse.issparse(self.operator):
+                V_flat[...] = self.operator @ L
+            else:
+                np.dot(self.operator, L, out=V_flat)
+        return out
+    
+    @instrument.profiled('blockage.BlockageRenderer.renderBatch')
+    def renderBatch(self, E):
+        """
+        Render the volumes for a stack of difference matrices.
+        
+        Args:
+            E: [T, 4*N, 3*M] stack of difference matrices
+            
+        Returns:
+            V: [T, nx, ny, nz] volumes, or [T, *output_shape] with a projection
+        """
+        L = lineWeights(E, self.ns, self.nl).astype(self.dtype, copy=False)
+        if scipy.sparse.issparse(self.operator):
+            V_flat = np.ascontiguousarray((self.operator @ L.T).T)
+        else:
+            V_flat = L @ self.operator.T
+        # Row t reshaped in Fortran order to output_shape
+        shape = self.output_shape[::-1]
+        axes = (0,) + tuple(range(len(shape), 0, -1))
+        return V_flat.reshape((L.shape[0],) + shape).transpose(axes)
+
+def _blockCenters(dim, origins, size):
+    """
+    Centers of the blocks of size^3 voxels with the given origins, cropped
+    to the grid.
+    
+    Args:
+        dim: [dim_x, dim_y, dim_z]
+        origins: [B, 3] integer voxel coordinates of the block corners
+        size: block edge in voxels
+        
+    Returns:
+        centers: [B, 3] float coordinates
+    """
+    extent = np.minimum(size, np.asarray(dim) - origins)
+    return origins + (extent - 1) / 2.0
+
+def _subdivideBlocks(dim, origins, size, child_size):
+    """
+    Origins of the child_size blocks tiling each size block, inside the grid.
+    """
+    steps = np.arange(0, size, child_size)
+    offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape((-1, 3))
+    children = (origins[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape((-1, 3))
+    return children[np.all(children < np.asarray(dim), axis=1)]
+
+def _fillBlocks(out, origins, size, values):
+    """
+    Set every voxel of the size^3 blocks at origins to the value of its block.
+    """
+    steps = np.arange(size)
+    offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape((-1, 3))
+    voxels = (origins[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape((-1, 3))
+    block_values = np.repeat(values, len(offsets))
+    inside = np.all(voxels < np.asarray(out.shape), axis=1)
+    voxels = voxels[inside]
+    out[voxels[:, 0], voxels[:, 1], voxels[:, 2]] = block_values[inside]
+
+def _pointValues(points, S, D, sigma, L, block, n_jobs):
+    """
+    Normalized blockage sum_j H[i, j] L[j] / sum_j H[i, j] at arbitrary
+    points, evaluated block by block with the exact kernel.
+    
+    Args:
+        points: [P, 3] coordinates
+        S, D: output of _lineEndpoints
+        sigma: scalar
+        L: [ns*nl] float64 line weights
+        block: number of points per block
+        n_jobs: number of worker threads
+        
+    Returns:
+        values: [P] float64, zero where all the weights underflow
+    """
+    values = np.zeros(len(points))
+    
+    def evaluate(start):
+        p = points[start:start + block]
+        H_block = _gaussianBlock((p[:, 0], p[:, 1], p[:, 2]), S, D, sigma)
+        denominator = np.sum(H_block, axis=1)
+        np.divide(H_block @ L, denominator, out=values[start:start + len(p)],
+                  where=denominator != 0)
+    
+    _parallelMap(evaluate, range(0, len(points), block), n_jobs)
+    return values
+
+class CoarseToFineRenderer:
+    """
+    Multi-resolution renderer of blockage volumes, whose cost per frame
+    scales with the occupied part of the room rather than with its volume.
+    
+    The room is tiled into blocks of factors[0]^3 voxels, and the normalized
+    blockage of volumeFromHashing is first evaluated at the block centers
+    through a small precomputed operator, as a BlockageRenderer on the coarse
+    grid would. Blocks whose value reaches the threshold are split into
+    blocks of the next factor, evaluated again at their centers, and so on
+    down to single voxels, which are evaluated with the exact kernel. Voxels
+    of the blocks that stopped early take the value of their block.
+    
+    Refined voxels therefore equal the volume of volumeFromHashing (up to
+    rounding). The coarse levels are point samples, so a block can miss a
+    peak narrower than itself; use factors well below sigma, or a wider
+    sigma at the coarse levels (e.g. sqrt(sigma^2 + factor^2 / 12), which
+    blurs over the block), to keep occupied blocks above the threshold.
+    
+    Args:
+        sensors: [N, 3] coordinates
+        lights: [M, 3] coordinates
+        dim: [dim_x, dim_y, dim_z]
+        sigma: scalar, sigma of the exact voxel level
+        factors: block edges of the coarse levels in voxels, from the
+            coarsest. Each must be a multiple of the next one.
+        sigmas: sigma of each coarse level, in voxel units. Default sigma.
+        threshold: blocks are refined where their value is at least
+            threshold, times the largest value of the coarsest level if
+            relative. A frame whose largest value is not positive (e.g. a
+            noisy or brightened E) has no reference, so with relative it is
+            refined everywhere.
+        relative: see threshold
+        dtype: dtype of rendered volumes. The kernel is evaluated in float64.
+        max_memory: approximate cap in bytes on the temporaries of one
+            block of points, as in hashGaussians
+        n_jobs: number of worker threads of the refinement
+    
+    Attributes:
+        operator: [n_blocks, ns*nl] normalized operator of the coarsest level
+        output_shape: dim
+    """
+    
+    @instrument.profiled('blockage.CoarseToFineRenderer.build',
+                         lambda self, sensors, lights, dim, *args, **kwargs:
+                         _geometrySizes(sensors, lights, dim))
+    def __init__(self, sensors, lights, dim, sigma, factors=(4,), sigmas=None, threshold=0.1,
+                 relative=True, dtype=np.float64, max_memory=None, n_jobs=None):
+        self.ns = sensors.shape[0]
+        self.nl = lights.shape[0]
+        self.dim = tuple(int(d) for d in dim)
+        self.output_shape = self.dim
+        self.sigma = sigma
+        self.factors = tuple(int(f) for f in factors)
+        self.sigmas = tuple(sigmas) if sigmas is not None else (sigma,) * len(self.factors)
+        self.threshold = threshold
+        self.relative = relative
+        self.dtype = np.dtype(dtype)
+        
+        if not self.factors or len(self.sigmas) != len(self.factors):
+            raise ValueError("factors must be non-empty, with one sigma per factor")
+        for coarse, fine in zip(self.factors, self.factors[1:] + (1,)):
+            if fine < 1 or coarse <= fine or coarse % fine:
+                raise ValueError("each factor must be a multiple of the next one, "
+                                 "and the last one larger than 1, got %s" % (self.factors,))
+        
+        num_lines = self.ns * self.nl
+        self._n_jobs = _numJobs(n_jobs)
+        self._block = 4096
+        if max_memory is not None:
+            self._block = max(max_memory // (_TEMPORARIES_PER_ENTRY * 8 * max(num_lines, 1)), 1)
+        self._S, self._D = _lineEndpoints(sensors, lights)
+        
+        # Coarsest blocks in Fortran order of the coarse grid
+        factor = self.factors[0]
+        self._coarse_shape = tuple(-(-d // factor) for d in self.dim)
+        x, y, z = _voxelCoordinates(self._coarse_shape, 0, int(np.prod(self._coarse_shape)))
+        self._origins = factor * np.stack([x, y, z], axis=1)
+        
+        pts = _blockCenters(self.dim, self._origins, factor)
+        H_coarse = np.empty((len(pts), num_lines))
+        for start in range(0, len(pts), self._block):
+            p = pts[start:start + self._block]
+            _gaussianBlock((p[:, 0], p[:, 1], p[:, 2]), self._S, self._D, self.sigmas[0],
+                           out=H_coarse[start:start + len(p)])
+        denominator = np.sum(H_coarse, axis=1)
+        inv = np.zeros_like(denominator)
+        np.divide(1.0, denominator, out=inv, where=denominator != 0)
+        H_coarse *= inv[:, np.newaxis]
+        self.operator = H_coarse
+    
+    @instrument.profiled('blockage.CoarseToFineRenderer.render')
+    def render(self, E, out=None, return_refined=False):
+        """
+        Render the volume for one difference matrix.
+        
+        The renderer is not modified, so concurrent calls are safe as long
+        as they do not share out.
+        
+        Args:
+            E: [4*N, 3*M] difference matrix, or its column-major flat form
+            out: optional Fortran-ordered [nx, ny, nz] array of the
+                 renderer's dtype to write the volume into
+            return_refined: also return the number of voxels evaluated with
+                 the exact kernel
+            
+        Returns:
+            V: [nx, ny, nz] volume (out, if given)
+            refined: number of refined voxels, if return_refined
+        """
+        L = lineWeights(E, self.ns, self.nl).astype(np.float64, copy=False)
+        
+        if out is None:
+            out = np.empty(self.output_shape, dtype=self.dtype, order='F')
+        elif (out.shape != self.output_shape or out.dtype != self.dtype
+              or not out.flags.f_contiguous):
+            raise ValueError("out must be a Fortran-ordered %s array of shape %s"
+                             % (self.dtype, self.output_shape))
+        
+        factor = self.factors[0]
+        with instrument.stage('blockage.CoarseToFineRenderer.render.coarse',
+                              blocks=len(self._origins), lines=L.size):
+            values = self.operator @ L
+            coarse = values.reshape(self._coarse_shape, order='F')
+            nx, ny, nz = self.dim
+            out[...] = coarse.repeat(factor, 0)[:nx].repeat(factor, 1)[:, :ny].repeat(factor, 2)[:, :, :nz]
+        
+        threshold = self.threshold
+        if self.relative:
+            peak = values.max() if values.size else 0.0
+            threshold = threshold * peak if peak > 0 else -np.inf
+        origins = self._origins[values >= threshold]
+        
+        refined = 0
+        for level, size in enumerate(self.factors):
+            if not len(origins):
+                break
+            child_size = self.factors[level + 1] if level + 1 < len(self.factors) else 1
+            children = _subdivideBlocks(self.dim, origins, size, child_size)
+            sigma = self.sigmas[level + 1] if child_size > 1 else self.sigma
+            with instrument.stage('blockage.CoarseToFineRenderer.render.refine',
+                                  block=child_size, points=len(children), lines=L.size):
+                values = _pointValues(_blockCenters(self.dim, children, child_size), self._S,
+                                      self._D, sigma, L, self._block, self._n_jobs)
+                if child_size == 1:
+                    out[children[:, 0], children[:, 1], children[:, 2]] = values
+                    refined = len(children)
+                else:
+                    _fillBlocks(out, children, child_size, values)
+                    origins = children[values >= threshold]
+        return (out, refined) if return_refined else out
+    
+    def renderBatch(self, E):
+        """
+        Render the volumes for a stack of difference matrices.
+        
+        Args:
+            E: [T, 4*N, 3*M] stack of difference matrices
+            
+        Returns:
+            V: [T, nx, ny, nz] volumes
+        """
+        return np.stack([self.render(E_t) for E_t in np.asarray(E)])
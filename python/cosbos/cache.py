@@ -0,0 +1,166 @@
+import collections
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import scipy.sparse
+
+from . import blockage
+
+# Bump when the layout of the cached H changes so stale files are not reused.
+_CACHE_VERSION = 1
+
+def geometryKey(sensors, lights, dim, sigma, dtype=np.float64, cutoff=None, method='dense'):
+    """
+    Content hash of the room geometry and hashing options that determine H.
+
+    Options that only affect memory or speed (max_memory, n_jobs) are not
+    part of the key.
+
+    Args:
+        sensors: [N, 3] coordinates
+        lights: [M, 3] coordinates
+        dim: [dim_x, dim_y, dim_z]
+        sigma: scalar
+        dtype: dtype of the cached H
+        cutoff: cutoff of hashGaussians
+        method: method of hashGaussians
+
+    Returns:
+        key: hex digest string
+    """
+    h = hashlib.sha256()
+    h.update(b'cosbos-hash-v%d' % _CACHE_VERSION)
+    for arr in (np.asarray(sensors, dtype=np.float64),
+                np.asarray(lights, dtype=np.float64),
+                np.asarray(dim, dtype=np.int64).ravel()):
+        h.update(repr(arr.shape).encode())
+        h.update(np.ascontiguousarray(arr).tobytes())
+    h.update(repr(float(sigma)).encode())
+    h.update(np.dtype(dtype).str.encode())
+    # Only hashed when set, so keys of the default dense H are unchanged
+    if cutoff is not None or method != 'dense':
+        h.update(repr((None if cutoff is None else float(cutoff), method)).encode())
+    return h.hexdigest()
+
+def atomicSave(path, save):
+    """
+    Call save(f) on a temporary file next to path, then move it into place,
+    so concurrent readers never see a partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class HashCache:
+    """
+    Two-tier cache of hashGaussians results keyed on room geometry.
+
+    The first tier is an in-process LRU of up to max_entries arrays. The
+    optional second tier stores each H as <key>.npy under cache_dir, and a
+    warm start loads it zero-copy with np.load(mmap_mode='r'). Sparse H
+    (with a cutoff) are stored as <key>.npz and loaded into memory.
+
+    Returned arrays are read-only, since they are shared between callers.
+
+    Attributes:
+        hits: lookups served from the in-process tier
+        disk_hits: lookups served from the on-disk tier
+        misses: lookups that had to call hashGaussians
+    """
+
+    def __init__(self, cache_dir=None, max_entries=4):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, sensors, lights, dim, sigma, dtype=np.float64, **hash_options):
+        """
+        H for the geometry, as returned by hashGaussians.
+
+        Args:
+            sensors: [N, 3] coordinates
+            lights: [M, 3] coordinates
+            dim: [dim_x, dim_y, dim_z]
+            sigma: scalar
+            dtype: dtype of the returned H
+            hash_options: passed to hashGaussians (max_memory, cutoff,
+                method, n_jobs). Only cutoff and method are part of the key.
+
+        Returns:
+            H: [prod(dim) * N * M] read-only flat array, or read-only sparse
+               matrix if hash_options has a cutoff
+        """
+        key = geometryKey(sensors, lights, dim, sigma, dtype,
+                          cutoff=hash_options.get('cutoff'),
+                          method=hash_options.get('method', 'dense'))
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        path = self._path(key, sparse=hash_options.get('cutoff') is not None)
+        if path is not None and os.path.exists(path):
+            if path.endswith('.npz'):
+                H = scipy.sparse.load_npz(path)
+                _setReadOnly(H)
+            else:
+                H = np.load(path, mmap_mode='r')
+            self.disk_hits += 1
+        else:
+            H = blockage.hashGaussians(sensors, lights, dim, sigma, dtype=dtype, **hash_options)
+            _setReadOnly(H)
+            self.misses += 1
+            if path is not None:
+                self._save(path, H)
+
+        self._entries[key] = H
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return H
+
+    def clear(self, disk=False):
+        """
+        Drop the in-process tier, and the on-disk tier if disk is True.
+        """
+        self._entries.clear()
+        if disk and self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(('.npy', '.npz')):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+    def _path(self, key, sparse=False):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, key + ('.npz' if sparse else '.npy'))
+
+    def _save(self, path, H):
+        if scipy.sparse.issparse(H):
+            atomicSave(path, lambda f: scipy.sparse.save_npz(f, H, compressed=False))
+        else:
+            atomicSave(path, lambda f: np.save(f, H))
+
+def _setReadOnly(H):
+    # The arrays behind a sparse matrix, or the array itself
+    if scipy.sparse.issparse(H):
+        for arr in (H.data, H.indices, H.indptr):
+            arr.flags.writeable = False
+    else:
+        H.flags.writeable = False
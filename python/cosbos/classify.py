@@ -0,0 +1,226 @@
+import numpy as np
+
+from . import blockage
+from . import instrument
+
+# Sensors and lights of BlockageModel/coordinates_blockage.m (inches)
+TESTBED_SENSORS = np.array([
+    [85.5, 34, 34], [85.5, 34, 17], [85.5, 68, 34], [85.5, 68, 17],
+    [85.5, 102, 34], [85.5, 102, 17], [0, 101.5, 34], [0, 101.5, 17],
+    [0, 68, 34], [0, 68, 17], [0, 33.5, 34], [0, 33.5, 17]])
+TESTBED_LIGHTS = np.array([
+    [75, 22.5, 86.4], [75, 46.5, 86.4], [75, 70.5, 86.4], [75, 94.5, 86.4],
+    [75, 118.5, 86.4], [55.5, 118.5, 86.4], [31.5, 118.5, 86.4], [12, 118.5, 86.4],
+    [12, 94.5, 86.4], [12, 70.5, 86.4], [12, 46.5, 86.4], [12, 22.5, 86.4]])
+TESTBED_DIM = (87, 136, 88)
+TESTBED_SIGMA = 20
+
+# Occupancy classes of the data sets (DataDescription.txt). Seen in the
+# floor plane of demo_Blockage.m, after its y-axis mirror:
+#   Z  X  V
+#   Y  W  U
+# The first row is x < dim_x / 2. Without the mirror, as rendered by the
+# Python package, y increases from the U/V column to the Y/Z column.
+EMPTY = '0'
+REGION_LAYOUT = (('V', 'X', 'Z'),
+                 ('U', 'W', 'Y'))
+COMBINATIONS = {'A': ('U', 'V'), 'B': ('W', 'X'), 'C': ('Y', 'Z')}
+
+def testbedGeometry(dim=TESTBED_DIM):
+    """
+    Sensors and lights of coordinates_blockage.m, scaled to a
+    [dim_x, dim_y, dim_z] grid, and the matching sigma.
+
+    Returns:
+        sensors: [12, 3]
+        lights: [12, 3]
+        sigma: scalar
+    """
+    scale = np.asarray(dim, dtype=np.float64) / np.asarray(TESTBED_DIM)
+    return TESTBED_SENSORS * scale, TESTBED_LIGHTS * scale, TESTBED_SIGMA * scale[0]
+
+def boxMask(dim, box):
+    """
+    Boolean mask of a box of voxels.
+
+    Args:
+        dim: [dim_x, dim_y, dim_z]
+        box: ((x0, x1), (y0, y1)) for a floor region at all heights, or
+            ((x0, x1), (y0, y1), (z0, z1)); half-open voxel index ranges
+
+    Returns:
+        mask: [nx, ny, nz] boolean array
+    """
+    mask = np.zeros(tuple(int(d) for d in dim), dtype=bool)
+    mask[tuple(slice(int(lo), int(hi)) for lo, hi in box)] = True
+    return mask
+
+def roomRegions(dim=TESTBED_DIM, layout=REGION_LAYOUT):
+    """
+    Floor regions of the testbed classes: the room split into len(layout)
+    bands along x and len(layout[0]) bands along y.
+
+    Returns:
+        regions: dict from class name to [nx, ny, nz] boolean mask
+    """
+    nx, ny = int(dim[0]), int(dim[1])
+    x_edges = np.linspace(0, nx, len(layout) + 1).round().astype(int)
+    y_edges = np.linspace(0, ny, len(layout[0]) + 1).round().astype(int)
+    regions = {}
+    for i, row in enumerate(layout):
+        for j, name in enumerate(row):
+            regions[name] = boxMask(dim, ((x_edges[i], x_edges[i + 1]),
+                                          (y_edges[j], y_edges[j + 1])))
+    return regions
+
+class RegionClassifier:
+    """
+    Occupancy classifier scoring difference matrices E = A0 - A against
+    per-region signatures of the blockage model.
+
+    The score of a region is the mean over its voxels of the volume that
+    volumeFromHashing would render. Since rendering is linear in E, the
+    scores are S @ vec(E) for a [n_regions, 4*N*3*M] signature matrix S that
+    folds the line-weight extraction, the normalized hashing operator and
+    the region averaging together. S is built once, slab by slab, through a
+    projected BlockageRenderer; each decision is then one small matrix-vector
+    product, and a batch of frames one matrix product, with no volume.
+
+    Decision rule: EMPTY if the best score is at most empty_threshold,
+    otherwise the best region, or the combination (e.g. 'A' = U and V) of
+    the best region and a partner scoring at least combination_ratio times
+    as much.
+
+    Args:
+        sensors: [N, 3] coordinates
+        lights: [M, 3] coordinates
+        dim: [dim_x, dim_y, dim_z]
+        sigma: scalar
+        regions: dict from name to region, a boolean mask [nx, ny] or
+            [nx, ny, nz] or a box for boxMask. Default roomRegions(dim).
+        combinations: dict from name to a pair of region names
+        empty_threshold: see the decision rule, or calibrateEmpty
+        combination_ratio: see the decision rule. None disables combinations.
+        dtype: dtype of the signatures
+        renderer_options: passed to blockage.BlockageRenderer (max_memory,
+            cutoff, H, n_jobs)
+
+    Attributes:
+        names: region names, in the order of the scores
+        signatures: [n_regions, 4*N*3*M] matrix acting on E.ravel() (C order)
+    """
+
+    def __init__(self, sensors, lights, dim, sigma, regions=None, combinations=COMBINATIONS,
+                 empty_threshold=0.0, combination_ratio=0.8, dtype=np.float64,
+                 **renderer_options):
+        dim = tuple(int(d) for d in dim)
+        if regions is None:
+            regions = roomRegions(dim)
+        self.names = list(regions)
+        self.combinations = {name: pair for name, pair in combinations.items()
+                             if pair[0] in regions and pair[1] in regions}
+        self.empty_threshold = empty_threshold
+        self.combination_ratio = combination_ratio
+
+        masks = np.empty((len(self.names),) + dim, dtype=bool)
+        for k, name in enumerate(self.names):
+            region = regions[name]
+            if isinstance(region, (tuple, list)):
+                region = boxMask(dim, region)
+            region = np.asarray(region, dtype=bool)
+            if region.ndim == 2:
+                region = region[:, :, np.newaxis]
+            masks[k] = region
+
+        renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma, projection=masks,
+                                             **renderer_options)
+        # Region sums to region means
+        P = renderer.operator / np.maximum(masks.reshape(len(masks), -1).sum(axis=1), 1)[:, np.newaxis]
+
+        # L[s + l*ns] sums E[4s + k, 3l + k] for k < 3, so the score of E is
+        # P @ L = S @ E.ravel() with S spreading each column of P to those
+        # three entries of E.
+        ns, nl = renderer.ns, renderer.nl
+        self.ns, self.nl = ns, nl
+        S = np.zeros((len(self.names), 4 * ns, 3 * nl), dtype=dtype)
+        P3 = P.reshape((len(self.names), nl, ns)).transpose(0, 2, 1) # [n, s, l]
+        for k in range(3):
+            S[:, k::4, k::3] = P3
+        self.signatures = S.reshape((len(self.names), -1))
+
+    def _flatten(self, E):
+        # E as [T, 4*ns*3*nl] rows in C order
+        E = np.asarray(E)
+        if E.ndim == 1:
+            E = E.reshape((4 * self.ns, 3 * self.nl), order='F')
+        return E.reshape((-1, self.signatures.shape[1]))
+
+    @instrument.profiled('classify.RegionClassifier.scores')
+    def scores(self, E):
+        """
+        Mean blockage of each region.
+
+        Args:
+            E: [4*N, 3*M] difference matrix (or its column-major flat form),
+               or a stack [T, 4*N, 3*M]
+
+        Returns:
+            scores: [n_regions], or [T, n_regions] for a stack
+        """
+        E = np.asarray(E)
+        scores = self._flatten(E) @ self.signatures.T
+        return scores if E.ndim == 3 else scores[0]
+
+    def decide(self, scores):
+        """
+        Class labels from region scores, by the decision rule.
+
+        Args:
+            scores: [n_regions] or [T, n_regions]
+
+        Returns:
+            label, or list of T labels
+        """
+        scores = np.asarray(scores)
+        single = scores.ndim == 1
+        scores = np.atleast_2d(scores)
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(scores)), best]
+
+        labels = []
+        for t in range(len(scores)):
+            if best_scores[t] <= self.empty_threshold:
+                labels.append(EMPTY)
+                continue
+            label = self.names[best[t]]
+            if self.combination_ratio is not None:
+                for name, pair in self.combinations.items():
+                    if label not in pair:
+                        continue
+                    partner = pair[1] if pair[0] == label else pair[0]
+                    if scores[t, self.names.index(partner)] >= self.combination_ratio * best_scores[t]:
+                        label = name
+                        break
+            labels.append(label)
+        return labels[0] if single else labels
+
+    def classify(self, E):
+        """
+        Class label of a difference matrix, or list of labels for a stack.
+        """
+        return self.decide(self.scores(E))
+
+    def calibrateEmpty(self, E_empty, margin=1.5):
+        """
+        Set empty_threshold from difference matrices of the empty room, to
+        margin times the largest region score among them.
+
+        Args:
+            E_empty: [T, 4*N, 3*M] stack (or a single matrix)
+
+        Returns:
+            empty_threshold
+        """
+        scores = np.atleast_2d(self.scores(E_empty))
+        self.empty_threshold = margin * float(scores.max())
+        return self.empty_threshold
@@ -0,0 +1,272 @@
+import collections
+import contextlib
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+
+# Where stage records go; None disables instrumentation.
+_sink = None
+_trace_allocations = False
+# Whether enable() started tracemalloc, and so disable() must stop it
+_started_tracing = False
+_local = threading.local()
+
+Record = collections.namedtuple('Record', ['stage', 'seconds', 'sizes', 'allocated_bytes'])
+Record.__doc__ = """
+One timed stage.
+
+Attributes:
+    stage: dotted stage name, e.g. 'blockage.volumeFromHashing.gemm'
+    seconds: wall time
+    sizes: dict of problem sizes (voxels, lines, ...) given by the stage
+    allocated_bytes: peak traced memory above the level at stage entry, or
+        None if allocations are not traced
+"""
+
+def enable(sink, allocations=False):
+    """
+    Send the records of every instrumented stage to sink.
+
+    Args:
+        sink: object with a record(Record) method, e.g. MemorySink
+        allocations: also trace the peak memory allocated by each stage with
+            tracemalloc. This slows down allocation-heavy stages noticeably,
+            and stages running in concurrent threads see each other's
+            allocations. Needs Python 3.9 or later. If tracemalloc is
+            already tracing, that session is used and left running.
+    """
+    global _sink, _trace_allocations, _started_tracing
+    if allocations and not hasattr(tracemalloc, 'reset_peak'):
+        raise RuntimeError("tracing allocations per stage needs Python 3.9 or later")
+    if allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    _trace_allocations = allocations
+    _sink = sink
+
+def disable():
+    """
+    Stop recording. Tracing started by enable(allocations=True) is stopped;
+    tracing started by the caller beforehand is not.
+    """
+    global _sink, _trace_allocations, _started_tracing
+    if _started_tracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _sink = None
+    _trace_allocations = False
+    _started_tracing = False
+
+def isEnabled():
+    return _sink is not None
+
+@contextlib.contextmanager
+def recording(sink, allocations=False):
+    """
+    Enable instrumentation for the body of a with statement.
+
+    Example:
+        with instrument.recording(instrument.MemorySink()) as sink:
+            renderer.render(E)
+        print(sink.stats())
+    """
+    global _sink, _trace_allocations, _started_tracing
+    previous = (_sink, _trace_allocations, _started_tracing)
+    # Tracing of an enclosing session is kept running by the nested one
+    _started_tracing = False
+    enable(sink, allocations)
+    try:
+        yield sink
+    finally:
+        disable()
+        _sink, _trace_allocations, _started_tracing = previous
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, name, sizes):
+        self.name = name
+        self.sizes = sizes
+
+    def __enter__(self):
+        self.traced = _trace_allocations
+        if self.traced:
+            # Peaks of nested stages are carried up to their parent, since
+            # tracemalloc has a single global peak.
+            stack = getattr(_local, 'stack', None)
+            if stack is None:
+                stack = _local.stack = []
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            stack.append([current, current])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        allocated = None
+        if self.traced and tracemalloc.is_tracing():
+            stack = _local.stack
+            base, peak = stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            allocated = peak - base
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+        sink = _sink
+        if sink is not None:
+            sink.record(Record(self.name, seconds, self.sizes, allocated))
+        return False
+
+def stage(name, **sizes):
+    """
+    Context manager timing a stage of work.
+
+    When instrumentation is disabled this returns a shared no-op context,
+    so instrumented code only pays for one function call.
+
+    Args:
+        name: dotted stage name
+        sizes: problem sizes to attach to the record
+    """
+    if _sink is None:
+        return _NULL_STAGE
+    return _Stage(name, sizes)
+
+def profiled(name, sizes=None):
+    """
+    Decorator timing every call of a function as stage name.
+
+    Args:
+        name: dotted stage name
+        sizes: optional function of the call's arguments returning the dict
+            of sizes to record. It is only called when enabled.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _sink is None:
+                return func(*args, **kwargs)
+            with _Stage(name, sizes(*args, **kwargs) if sizes is not None else {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class MemorySink:
+    """
+    Sink aggregating the records of each stage in memory.
+
+    Args:
+        keep: number of most recent raw records to keep in self.records
+    """
+
+    def __init__(self, keep=0):
+        self.records = collections.deque(maxlen=keep)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        with self._lock:
+            if self.records.maxlen:
+                self.records.append(record)
+            stats = self._stats.get(record.stage)
+            if stats is None:
+                stats = self._stats[record.stage] = {
+                    'count': 0, 'total': 0.0, 'min': float('inf'), 'max': 0.0,
+                    'max_allocated_bytes': None, 'sizes': {}}
+            stats['count'] += 1
+            stats['total'] += record.seconds
+            stats['min'] = min(stats['min'], record.seconds)
+            stats['max'] = max(stats['max'], record.seconds)
+            if record.allocated_bytes is not None:
+                stats['max_allocated_bytes'] = max(stats['max_allocated_bytes'] or 0,
+                                                   record.allocated_bytes)
+            stats['sizes'] = record.sizes
+
+    def stats(self):
+        """
+        Per-stage aggregates.
+
+        Returns:
+            stats: dict from stage name to a dict of count, total, min, max
+                and mean seconds, max_allocated_bytes and the sizes of the
+                last record
+        """
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                result[name] = dict(stats, mean=stats['total'] / stats['count'],
+                                    sizes=dict(stats['sizes']))
+            return result
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+            self._stats.clear()
+
+class LoggingSink:
+    """
+    Sink writing one log line per record.
+
+    Args:
+        logger: logging.Logger, by default the 'cosbos.instrument' logger
+        level: logging level of the records
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.level = level
+
+    def record(self, record):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        sizes = ' '.join('%s=%s' % item for item in record.sizes.items())
+        allocated = '' if record.allocated_bytes is None else ' allocated=%d' % record.allocated_bytes
+        self.logger.log(self.level, '%s %.6fs%s %s', record.stage, record.seconds, allocated, sizes)
+
+class PrometheusSink(MemorySink):
+    """
+    MemorySink that renders its aggregates in the Prometheus text
+    exposition format, for a metrics endpoint or a textfile collector.
+    """
+
+    def exposition(self, prefix='cosbos'):
+        """
+        Returns:
+            text: metrics in the Prometheus text format
+        """
+        stats = self.stats()
+        lines = [
+            '# HELP %s_stage_seconds Wall time of instrumented stages.' % prefix,
+            '# TYPE %s_stage_seconds summary' % prefix,
+        ]
+        for name in sorted(stats):
+            label = '{stage="%s"}' % name
+            lines.append('%s_stage_seconds_sum%s %.9g' % (prefix, label, stats[name]['total']))
+            lines.append('%s_stage_seconds_count%s %d' % (prefix, label, stats[name]['count']))
+        lines += [
+            '# HELP %s_stage_seconds_max Slowest call of instrumented stages.' % prefix,
+            '# TYPE %s_stage_seconds_max gauge' % prefix,
+        ]
+        for name in sorted(stats):
+            lines.append('%s_stage_seconds_max{stage="%s"} %.9g' % (prefix, name, stats[name]['max']))
+        allocated = [name for name in sorted(stats) if stats[name]['max_allocated_bytes'] is not None]
+        if allocated:
+            lines += [
+                '# HELP %s_stage_allocated_bytes_max Peak memory allocated by instrumented stages.' % prefix,
+                '# TYPE %s_stage_allocated_bytes_max gauge' % prefix,
+            ]
+            for name in allocated:
+                lines.append('%s_stage_allocated_bytes_max{stage="%s"} %d'
+                             % (prefix, name, stats[name]['max_allocated_bytes']))
+        return '\n'.join(lines) + '\n'
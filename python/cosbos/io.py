@@ -0,0 +1,563 @@
+import glob
+import hashlib
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+import scipy.io
+
+from . import cache
+
+# Variables needed for sensing; imgs (camera captures), info and t are skipped.
+SENSING_VARIABLES = ('TestLight', 'cdata', 'BaseLight', 'mag')
+
+# Bump when the layout of the cached captures changes.
+_CACHE_VERSION = 1
+
+def loadCapture(path, variables=SENSING_VARIABLES):
+    """
+    Read only the given variables of a COSBOS .mat capture.
+
+    Args:
+        path: .mat file, e.g. BlockageModel/Data/0_30876.mat
+        variables: names of the variables to read
+
+    Returns:
+        data: dict from variable name to array
+    """
+    data = scipy.io.loadmat(path, variable_names=list(variables))
+    missing = [name for name in variables if name not in data]
+    if missing:
+        raise KeyError("%s has no variable(s) %s" % (path, ", ".join(missing)))
+    return {name: data[name] for name in variables}
+
+def scenarioClass(path):
+    """
+    Occupancy scenario of a capture, from its Class_ID file name: '0' for the
+    empty room, or a letter for the occupied part of the room (see
+    DataDescription.txt).
+    """
+    return os.path.basename(path).split('_', 1)[0]
+
+def _frameArrays(frame):
+    """
+    (TestLight, cdata) of a measurement frame, given as a tuple or as a dict
+    (e.g. the output of scipy.io.loadmat).
+    """
+    if isinstance(frame, dict):
+        return np.asarray(frame['TestLight']), np.asarray(frame['cdata'])
+    TestLight, cdata = frame
+    return np.asarray(TestLight), np.asarray(cdata)
+
+def perturbationPair(frame):
+    """
+    Perturbations X and sensor responses Y of one measurement frame.
+
+    Each row of TestLight is a lighting condition and each row of cdata the
+    sensor readings under it. The first row is the base light, which is
+    subtracted from the others, as in demo_Blockage.m.
+
+    Args:
+        frame: (TestLight, cdata) tuple or dict with these keys.
+            TestLight: [N+1, 3*M], cdata: [N+1, 4*N_s]
+
+    Returns:
+        X: [3*M, N]
+        Y: [4*N_s, N]
+    """
+    TestLight, cdata = _frameArrays(frame)
+    X = (TestLight[1:, :] - TestLight[0, :]).T
+    Y = (cdata[1:, :] - cdata[0, :]).T
+    return X, Y
+
+def loadPerturbations(path, cache_dir=None):
+    """
+    Perturbations X and sensor responses Y of a capture, with the base light
+    row subtracted as described in DataDescription.txt.
+
+    If cache_dir is given, X and Y are stored there as an
+    uncompressed .npz keyed on the file path, size and modification time,
+    and later loads read that instead of the .mat file.
+
+    Args:
+        path: .mat file
+        cache_dir: optional directory for the cached arrays
+
+    Returns:
+        X: [3*M, N-1]
+        Y: [4*N_s, N-1]
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, _cacheKey(path) + '.npz')
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return cached['X'], cached['Y']
+
+    data = loadCapture(path, ('TestLight', 'cdata'))
+    X, Y = perturbationPair(data)
+    # Transposed views of the differences; store them contiguous
+    X = np.ascontiguousarray(X)
+    Y = np.ascontiguousarray(Y)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache.atomicSave(cache_path, lambda f: np.savez(f, X=X, Y=Y))
+    return X, Y
+
+def iterScenarios(directory, cache_dir=None, pattern='*.mat'):
+    """
+    Iterate over the captures of a directory in file name order, loading
+    each one only when it is reached.
+
+    Args:
+        directory: e.g. LTM_Recovery/Data
+        cache_dir: see loadPerturbations
+        pattern: glob pattern of the capture files
+
+    Yields:
+        label: scenario class, see scenarioClass
+        X: [3*M, N-1]
+        Y: [4*N_s, N-1]
+    """
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        X, Y = loadPerturbations(path, cache_dir)
+        yield scenarioClass(path), X, Y
+
+def _cacheKey(path):
+    stat = os.stat(path)
+    h = hashlib.sha256()
+    h.update(b'cosbos-capture-v%d' % _CACHE_VERSION)
+    h.update(os.path.abspath(path).encode())
+    h.update(b'%d:%d' % (stat.st_size, stat.st_mtime_ns))
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name + '-' + h.hexdigest()[:16]
+
+def quantizeVolume(V, dtype=np.uint8, value_range=None):
+    """
+    Map a volume linearly to the full range of an unsigned integer dtype,
+    as writeTiff.m does for uint8.
+
+    Args:
+        V: volume
+        dtype: np.uint8 or np.uint16
+        value_range: (vmin, vmax) mapped to 0 and the dtype maximum. By
+            default the min and max of V, as in writeTiff.m. Values outside
+            are clipped.
+
+    Returns:
+        Q: quantized volume
+        value_range: (vmin, vmax) used, to undo the mapping with
+            dequantizeVolume
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype(np.uint8), np.dtype(np.uint16)):
+        raise ValueError("dtype must be uint8 or uint16, got %s" % dtype)
+    V = np.asarray(V)
+    if value_range is None:
+        value_range = (float(V.min()), float(V.max()))
+    vmin, vmax = float(value_range[0]), float(value_range[1])
+
+    top = np.iinfo(dtype).max
+    scaled = np.subtract(V, vmin, dtype=np.float64 if V.dtype == np.float64 else np.float32)
+    if vmax > vmin:
+        scaled *= top / (vmax - vmin)
+    else:
+        scaled[...] = 0
+    np.clip(scaled, 0, top, out=scaled)
+    np.rint(scaled, out=scaled)
+    return scaled.astype(dtype), (vmin, vmax)
+
+def dequantizeVolume(Q, value_range, dtype=np.float32):
+    """
+    Inverse of quantizeVolume, up to the quantization step.
+    """
+    vmin, vmax = value_range
+    top = np.iinfo(Q.dtype).max
+    V = Q.astype(dtype)
+    V *= (vmax - vmin) / top
+    V += vmin
+    return V
+
+# TIFF tags and field types written by TiffVolumeWriter
+_TIFF_SHORT, _TIFF_LONG, _TIFF_ASCII = 3, 4, 2
+_TIFF_NONE, _TIFF_DEFLATE = 1, 8
+
+class TiffVolumeWriter:
+    """
+    Writer of volumes to a quantized multi-page TIFF, one page per z-slice,
+    like writeTiff.m. Successive volumes of a time series are appended as
+    further pages.
+
+    Each page is a grayscale image with rows along x and columns along y,
+    stored as a single Deflate (zlib) compressed strip. The quantization
+    range of each volume is stored in the ImageDescription of its first
+    page as 'cosbos frame=<t> vmin=<vmin> vmax=<vmax>'.
+
+    Args:
+        filename: output .tif file
+        dtype: np.uint8 or np.uint16
+        value_range: fixed (vmin, vmax) for every volume. By default each
+            volume is normalized to its own min and max, as in writeTiff.m.
+        compress: Deflate-compress the pages
+    """
+
+    def __init__(self, filename, dtype=np.uint8, value_range=None, compress=True):
+        self.filename = filename
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.value_range = value_range
+        self.compress = compress
+        self.n_frames = 0
+        self._file = open(filename, 'wb')
+        # Little-endian classic TIFF; the first IFD offset is patched later
+        self._file.write(b'II*\x00\x00\x00\x00\x00')
+        self._next_ifd_pointer = 4
+
+    def append(self, V):
+        """
+        Append the z-slices of the volume V [nx, ny, nz] as pages.
+        """
+        Q, (vmin, vmax) = quantizeVolume(V, self.dtype, self.value_range)
+        description = 'cosbos frame=%d vmin=%r vmax=%r' % (self.n_frames, vmin, vmax)
+        for k in range(Q.shape[2]):
+            self._writePage(Q[:, :, k], description if k == 0 else None)
+        self.n_frames += 1
+
+    def _writePage(self, page, description):
+        f = self._file
+        data = np.ascontiguousarray(page, dtype=self.dtype).tobytes()
+        if self.compress:
+            data = zlib.compress(data, 6)
+
+        f.seek(0, os.SEEK_END)
+        data_offset = f.tell()
+        f.write(data)
+        extra = b''
+        if description is not None:
+            extra = description.encode('ascii') + b'\x00'
+        extra_offset = f.tell()
+        f.write(extra)
+        if f.tell() % 2:
+            f.write(b'\x00')
+
+        height, width = page.shape
+        tags = [
+            (256, _TIFF_LONG, 1, width),
+            (257, _TIFF_LONG, 1, height),
+            (258, _TIFF_SHORT, 1, 8 * self.dtype.itemsize),
+            (259, _TIFF_SHORT, 1, _TIFF_DEFLATE if self.compress else _TIFF_NONE),
+            (262, _TIFF_SHORT, 1, 1), # BlackIsZero
+            (273, _TIFF_LONG, 1, data_offset),
+            (277, _TIFF_SHORT, 1, 1),
+            (278, _TIFF_LONG, 1, height),
+            (279, _TIFF_LONG, 1, len(data)),
+            (284, _TIFF_SHORT, 1, 1),
+            (339, _TIFF_SHORT, 1, 1), # unsigned integer samples
+        ]
+        if description is not None:
+            tags.append((270, _TIFF_ASCII, len(extra), extra_offset))
+        tags.sort()
+
+        ifd_offset = f.tell()
+        if ifd_offset + 6 + 12 * len(tags) >= 2**32:
+            raise ValueError("%s exceeds the 4 GiB limit of classic TIFF" % self.filename)
+        ifd = [struct.pack('<H', len(tags))]
+        for tag, field_type, count, value in tags:
+            if field_type == _TIFF_SHORT:
+                ifd.append(struct.pack('<HHIHH', tag, field_type, count, value, 0))
+            else:
+                ifd.append(struct.pack('<HHII', tag, field_type, count, value))
+        ifd.append(struct.pack('<I', 0))
+        f.write(b''.join(ifd))
+        next_pointer = f.tell() - 4
+
+        f.seek(self._next_ifd_pointer)
+        f.write(struct.pack('<I', ifd_offset))
+        self._next_ifd_pointer = next_pointer
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+def writeTiff(V, filename, dtype=np.uint8, compress=True):
+    """
+    Python implementation of writeTiff.m: normalize V to the range of dtype
+    and write its z-slices as a multi-page TIFF.
+    """
+    with TiffVolumeWriter(filename, dtype, compress=compress) as writer:
+        writer.append(V)
+
+def readTiff(filename):
+    """
+    Read back a TIFF written by TiffVolumeWriter.
+
+    Returns:
+        pages: [nx, ny, num_pages] quantized array; for a time series of
+            volumes with nz slices, frame t is pages[:, :, t*nz:(t+1)*nz]
+        descriptions: ImageDescription of each page (None if absent)
+    """
+    with open(filename, 'rb') as f:
+        buf = f.read()
+    if buf[:4] != b'II*\x00':
+        raise ValueError("%s is not a little-endian TIFF" % filename)
+
+    pages, descriptions = [], []
+    offset = struct.unpack_from('<I', buf, 4)[0]
+    while offset:
+        count = struct.unpack_from('<H', buf, offset)[0]
+        tags = {}
+        for i in range(count):
+            tag, field_type, n, value = struct.unpack_from('<HHII', buf, offset + 2 + 12 * i)
+            if field_type == _TIFF_SHORT:
+                value &= 0xFFFF
+            tags[tag] = (n, value)
+        offset = struct.unpack_from('<I', buf, offset + 2 + 12 * count)[0]
+
+        data = buf[tags[273][1]:tags[273][1] + tags[279][1]]
+        if tags[259][1] == _TIFF_DEFLATE:
+            data = zlib.decompress(data)
+        dtype = np.dtype('<u%d' % (tags[258][1] // 8))
+        pages.append(np.frombuffer(data, dtype=dtype).reshape(tags[257][1], tags[256][1]))
+        if 270 in tags:
+            n, start = tags[270]
+            descriptions.append(buf[start:start + n].rstrip(b'\x00').decode('ascii'))
+        else:
+            descriptions.append(None)
+    return np.stack(pages, axis=2), descriptions
+
+class ChunkedVolumeStore:
+    """
+    Append-only store of a time series of volumes in a directory.
+
+    Frames are quantized (or stored as float32) and written to .npy chunk
+    files of frames_per_chunk frames each, which can be memory-mapped back.
+    index.json records the frame shape, dtype, chunk size, number of frames
+    and the quantization range of every frame.
+
+    Opening an existing directory appends to it.
+
+    append, flush, close and read take a lock, so frames can be read while
+    another thread (e.g. a BackgroundWriter) appends.
+
+    Args:
+        directory: store directory, created if needed
+        dtype: np.uint8, np.uint16 or np.float32 (no quantization). Default
+            np.uint8 for a new store and the stored dtype for an existing
+            one, which must match if given.
+        frames_per_chunk: frames per chunk file
+        value_range: fixed quantization range, see quantizeVolume
+    """
+
+    def __init__(self, directory, dtype=None, frames_per_chunk=64, value_range=None):
+        self.directory = directory
+        self.value_range = value_range
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        index_path = os.path.join(directory, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            self.dtype = np.dtype(index['dtype'])
+            if dtype is not None and np.dtype(dtype) != self.dtype:
+                raise ValueError("store %s holds %s frames, not %s"
+                                 % (directory, self.dtype, np.dtype(dtype)))
+            self.frames_per_chunk = index['frames_per_chunk']
+            self.shape = tuple(index['shape']) if index['shape'] is not None else None
+            self.ranges = [tuple(r) if r is not None else None for r in index['ranges']]
+        else:
+            self.dtype = np.dtype(dtype if dtype is not None else np.uint8)
+            self.frames_per_chunk = int(frames_per_chunk)
+            self.shape = None
+            self.ranges = []
+        self._chunk = None
+        self._chunk_id = None
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def append(self, V):
+        """
+        Append one volume [nx, ny, nz].
+        """
+        with self._lock:
+            self._append(np.asarray(V))
+
+    def _append(self, V):
+        if self.shape is None:
+            self.shape = V.shape
+        elif V.shape != self.shape:
+            raise ValueError("volume of shape %s does not match the store shape %s"
+                             % (V.shape, self.shape))
+
+        if self.dtype.kind == 'f':
+            Q, value_range = V.astype(self.dtype), None
+        else:
+            Q, value_range = quantizeVolume(V, self.dtype, self.value_range)
+
+        t = len(self.ranges)
+        chunk_id, i = divmod(t, self.frames_per_chunk)
+        self._openChunk(chunk_id)[i] = Q
+        self.ranges.append(value_range)
+
+        if i == self.frames_per_chunk - 1:
+            self.flush()
+
+    def _chunkPath(self, chunk_id):
+        return os.path.join(self.directory, 'chunk_%06d.npy' % chunk_id)
+
+    def _openChunk(self, chunk_id):
+        if self._chunk_id != chunk_id:
+            self._closeChunk()
+            path = self._chunkPath(chunk_id)
+            if os.path.exists(path):
+                self._chunk = np.load(path, mmap_mode='r+')
+            else:
+                self._chunk = np.lib.format.open_memmap(
+                    path, mode='w+', dtype=self.dtype,
+                    shape=(self.frames_per_chunk,) + tuple(self.shape))
+            self._chunk_id = chunk_id
+        return self._chunk
+
+    def _closeChunk(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+            self._chunk = None
+            self._chunk_id = None
+
+    def flush(self):
+        """
+        Write the open chunk and the index to disk.
+        """
+        with self._lock:
+            if self._chunk is not None:
+                self._chunk.flush()
+            index = {'shape': list(self.shape) if self.shape is not None else None,
+                     'dtype': self.dtype.str, 'frames_per_chunk': self.frames_per_chunk,
+                     'n_frames': len(self.ranges), 'ranges': self.ranges}
+            cache.atomicSave(os.path.join(self.directory, 'index.json'),
+                             lambda f: f.write(json.dumps(index).encode()))
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._closeChunk()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def read(self, start, stop=None, dequantize=False):
+        """
+        Frames [start, stop) of the store.
+
+        Args:
+            start: first frame
+            stop: end frame, start + 1 by default
+            dequantize: map quantized frames back to float32 values
+
+        Returns:
+            V: [stop - start, nx, ny, nz]. Without dequantize, a read-only
+               memory map when the range lies in one chunk file.
+        """
+        with self._lock:
+            n = len(self.ranges)
+            stop = start + 1 if stop is None else stop
+            if not 0 <= start <= stop <= n:
+                raise IndexError("frames [%d, %d) out of range for %d frames" % (start, stop, n))
+            ranges = self.ranges[start:stop]
+
+            parts = []
+            t = start
+            while t < stop:
+                chunk_id, i = divmod(t, self.frames_per_chunk)
+                j = min(stop - t, self.frames_per_chunk - i) + i
+                if chunk_id == self._chunk_id:
+                    self._chunk.flush()
+                parts.append(np.load(self._chunkPath(chunk_id), mmap_mode='r')[i:j])
+                t += j - i
+        if not parts:
+            V = np.empty((0,) + tuple(self.shape or ()), dtype=self.dtype)
+        else:
+            V = parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+        if dequantize and self.dtype.kind == 'u':
+            return np.stack([dequantizeVolume(V[k], ranges[k])
+                             for k in range(V.shape[0])])
+        return V
+
+class BackgroundWriter:
+    """
+    Run the appends of a volume writer (TiffVolumeWriter or
+    ChunkedVolumeStore) in a background thread, so that rendering does not
+    wait for the disk.
+
+    At most max_pending volumes are queued; append() blocks beyond that,
+    which bounds memory if the disk cannot keep up. Errors of the writer
+    are raised by the next append() or by close().
+
+    Args:
+        writer: object with append(V) and close() methods
+        max_pending: queue length
+        copy: copy volumes before queueing them. Needed when the caller
+            reuses its buffers, e.g. pipeline.renderVolumes(double_buffer=True).
+    """
+
+    def __init__(self, writer, max_pending=4, copy=True):
+        self.writer = writer
+        self.copy = copy
+        self._queue = queue.Queue(maxsize=max(int(max_pending), 1))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            V = self._queue.get()
+            if V is None:
+                return
+            if self._error is None:
+                try:
+                    self.writer.append(V)
+                except BaseException as error:
+                    self._error = error
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def append(self, V):
+        self._raise()
+        self._queue.put(np.array(V, copy=True) if self.copy else V)
+
+    def close(self):
+        """
+        Wait for the queued volumes to be written, then close the writer.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            self.writer.close()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -1,8 +1,24 @@
+import concurrent.futures
+import os
+import time
+import warnings
+from multiprocessing import shared_memory
+
 import numpy as np
 import scipy.linalg
-from sklearn.linear_model import OrthogonalMatchingPursuit
+from sklearn.linear_model import orthogonal_mp_gram
 import cvxpy as cp
 
+from . import instrument
+
+def _problemSizes(X, Y, *args, **kwargs):
+    # Sizes recorded by the instrumented solvers of this module
+    return {'m': X.shape[-2], 'N': X.shape[-1], 'l': Y.shape[-2]}
+
+def _batchSizes(Xs, Ys, *args, **kwargs):
+    return dict(_problemSizes(Xs, Ys), rooms=len(Xs))
+
+@instrument.profiled('ltm.solve_A_fullrank', _problemSizes)
 def solve_A_fullrank(X, Y):
     """
     Solve Y = AX for A using standard pseudo-inverse.
@@ -22,142 +38,519 @@ def solve_A_fullrank(X, Y):
     solution, residuals, rank, s = scipy.linalg.lstsq(X.T, Y.T)
     return solution.T
 
-def solve_A_Fnorm(X, Y):
+class FnormSolver:
+    """
+    Factorized solver of Y = AX for a fixed perturbation design X.
+    
+    The truncated pseudo-inverse of X is computed once from its thin SVD
+    X = U S V.T, keeping the singular values above threshold:
+    
+        pinv = V_r diag(1 / s_r) U_r.T    ([N, m])
+    
+    Each new Y then costs a single [l, N] @ [N, m] product. Memory is
+    O(m*N); the [N, N] V of a full SVD is never formed.
+    
+    Args:
+        X: [m, N]
+        threshold: singular values at or below it are discarded
+        
+    Attributes:
+        pinv: [N, m] truncated pseudo-inverse of X
+        rank: number of singular values kept
+    """
+    
+    def __init__(self, X, threshold=0.01):
+        self.threshold = threshold
+        
+        # Python's Vt is MATLAB's V'
+        U, s_vals, Vt = scipy.linalg.svd(X, full_matrices=False)
+        
+        # Remove small singular values
+        nn = int(np.sum(s_vals > threshold))
+        self.rank = nn
+        
+        # V_r diag(1 / s_r) U_r.T, scaling the columns of V_r in place
+        self.pinv = (Vt[:nn, :].T / s_vals[:nn]) @ U[:, :nn].T
+    
+    @instrument.profiled('ltm.FnormSolver.solve')
+    def solve(self, Y):
+        """
+        Args:
+            Y: [l, N]
+            
+        Returns:
+            A: [l, m]
+        """
+        return Y @ self.pinv
+
+@instrument.profiled('ltm.solve_A_Fnorm', _problemSizes)
+def solve_A_Fnorm(X, Y, threshold=0.01):
     """
     Solve Y = AX for A by minimizing Frobenius norm of changes (low rank approx).
     
+    When X is fixed and Y changes, build a FnormSolver once instead.
+    
     Args:
         X: [m, N]
         Y: [l, N]
+        threshold: singular values of X at or below it are discarded
         
     Returns:
         A: [l, m]
     """
-    threshold = 0.01
+    return FnormSolver(X, threshold).solve(Y)
+
+@instrument.profiled('ltm.solve_A_0norm', _problemSizes)
+def solve_A_0norm(X, Y, tol=1e-6, n_jobs=None, return_info=False):
+    """
+    Solve Y = AX for A by minimizing L0-norm using OMP.
+    
+    The MATLAB code runs OMP on vec(AX) = (X.T kron I) vec(A) = vec(Y).
+    That system decouples into one problem per row of A, X.T @ A[i, :] = Y[i, :],
+    all with the same dictionary X.T. So instead of materializing the
+    [N*l, m*l] Kronecker product, OMP runs on every row at once from the
+    shared [m, m] Gram matrix X @ X.T (sklearn's precompute=True path).
+    
+    Args:
+        X: [m, N]
+        Y: [l, N]
+        tol: maximum squared norm of the total residual, split evenly
+             between the rows
+        n_jobs: if given, rows are solved one by one in a pool of n_jobs
+            processes (-1 for all cores) sharing X through shared memory
+        return_info: also return per-row timing and convergence stats
+        
+    Returns:
+        A: [l, m]
+        info: (if return_info) list of per-row dicts, see _solveRows
+    """
     l = Y.shape[0]
-    m = X.shape[0]
     
-    # SVD of X: X = U * S * V.T
-    U, s_vals, Vt = scipy.linalg.svd(X, full_matrices=True)
+    if n_jobs is not None or return_info:
+        return _solveRows('0norm', X, Y, n_jobs, return_info, tol=tol / l)
     
-    # Remove small singular values
-    mask = s_vals > threshold
-    nn = np.sum(mask)
+    Gram = X @ X.T
+    Xy = X @ Y.T # [m, l], one column per row of A
+    norms_squared = np.sum(Y**2, axis=1)
     
-    S_reduced = s_vals[:nn]
-    V_reduced = Vt[:nn, :].T # V in MATLAB is V from SVD (m x m), here we need V corresponding to X's columns?
-    # Python svd returns Vt (transposed).
-    # X (m x N) = U (m x K) * S (K) * Vt (K x N)
-    # In MATLAB: [U, S, V] = svd(X) => X = U * S * V'.
-    # So Python's Vt is MATLAB's V'.
-    # MATLAB: V = V(:, 1:nn). Python: Vt = Vt[:nn, :] => V = Vt.T
+    coef = orthogonal_mp_gram(Gram, Xy, tol=tol / l, norms_squared=norms_squared)
+    return np.asarray(coef).reshape((X.shape[0], l)).T
+
+@instrument.profiled('ltm.solve_A_1norm', _problemSizes)
+def solve_A_1norm(X, Y, n_jobs=None, return_info=False, solver=None, tol=None):
+    """
+    Solve Y = AX for A by minimizing L1-norm (Basis Pursuit).
     
-    V_reduced = Vt[:nn, :].T # shape [N, nn]
+    min ||vec(A)||_1 s.t. (X.T kron I) vec(A) = vec(Y) is posed directly on
+    the matrix variable A with the constraint A @ X == Y, which is the same
+    program without materializing the [N*l, m*l] Kronecker product.
     
-    # Regression
-    # Y = Y * V
-    Y_proj = Y @ V_reduced
+    When X is fixed and Y changes, build a BasisPursuitSolver once instead.
     
-    # Sinv = diag(1 ./ diag(S))
-    Sinv = np.diag(1.0 / S_reduced)
+    Args:
+        X: [m, N]
+        Y: [l, N]
+        n_jobs: if given, rows are solved one by one in a pool of n_jobs
+            processes (-1 for all cores) sharing X through shared memory
+        return_info: also return per-row timing and convergence stats
+        solver: cvxpy solver name (e.g. 'SCS', 'ECOS', 'OSQP', 'CLARABEL')
+        tol: solver tolerance, see BasisPursuitSolver
+        
+    Returns:
+        A: [l, m]
+        info: (if return_info) list of per-row dicts, see _solveRows
+    """
+    if n_jobs is not None or return_info:
+        return _solveRows('1norm', X, Y, n_jobs, return_info, solver=solver, tol=tol)
     
-    # Z1 = Y * Sinv
-    Z1 = Y_proj @ Sinv
+    return BasisPursuitSolver(X, Y.shape[0], solver=solver, tol=tol).solve(Y)
+
+# Options that set the tolerance of each cvxpy backend
+_TOLERANCE_OPTIONS = {
+    'SCS': ('eps_abs', 'eps_rel'),
+    'ECOS': ('abstol', 'reltol', 'feastol'),
+    'OSQP': ('eps_abs', 'eps_rel'),
+    'CLARABEL': ('tol_gap_abs', 'tol_gap_rel', 'tol_feas'),
+}
+
+class BasisPursuitSolver:
+    """
+    Reusable basis pursuit program min ||vec(A)||_1 s.t. A @ X == Y.
     
-    # Z = [Z1, zeros(l, m - nn)]
-    # Wait, Z1 is [l, nn]. We need [l, m].
-    # So we pad columns.
-    Z = np.hstack([Z1, np.zeros((l, m - nn))])
+    X and Y are cvxpy Parameters of a DPP-compliant problem, so cvxpy
+    canonicalizes it once, on the first solve, and later solves only map
+    the new parameter values to the solver data and warm start the solver.
+    Re-solving every sensing epoch then costs about the pure solver time.
     
-    # A = Z * U'
-    A = Z @ U.T
+    Args:
+        X: [m, N] initial value of X
+        l: number of rows of Y (and A)
+        solver: cvxpy solver name (e.g. 'SCS', 'ECOS', 'OSQP', 'CLARABEL');
+            None lets cvxpy choose
+        tol: tolerance passed to the solver's absolute and relative
+             tolerance options. Requires one of the solvers above.
+        solver_options: other keyword arguments of cvxpy's Problem.solve
+        
+    Attributes:
+        setup_time: seconds spent compiling the problem (first solve)
+        solve_time: seconds spent in the last solve, excluding compilation
+        status: cvxpy status of the last solve
+    """
     
-    return A
+    def __init__(self, X, l, solver=None, tol=None, **solver_options):
+        m, N = X.shape
+        if solver is not None and solver not in cp.installed_solvers():
+            raise ValueError("solver %r is not installed, available: %s"
+                             % (solver, cp.installed_solvers()))
+        
+        self.solver = solver
+        self.solver_options = dict(solver_options)
+        if tol is not None:
+            if solver not in _TOLERANCE_OPTIONS:
+                raise ValueError("tol requires one of the solvers %s" % sorted(_TOLERANCE_OPTIONS))
+            for key in _TOLERANCE_OPTIONS[solver]:
+                self.solver_options.setdefault(key, tol)
+        
+        self._X = cp.Parameter((m, N), value=X)
+        self._Y = cp.Parameter((l, N))
+        self._A = cp.Variable((l, m))
+        self.problem = cp.Problem(cp.Minimize(cp.sum(cp.abs(self._A))),
+                                  [self._A @ self._X == self._Y])
+        
+        self.setup_time = None
+        self.solve_time = None
+        self.status = None
+        self.n_solves = 0
+    
+    @instrument.profiled('ltm.BasisPursuitSolver.solve')
+    def solve(self, Y, X=None):
+        """
+        Args:
+            Y: [l, N]
+            X: optional new [m, N] value of X
+            
+        Returns:
+            A: [l, m]
+        """
+        if X is not None:
+            self._X.value = X
+        self._Y.value = Y
+        
+        t0 = time.perf_counter()
+        self.problem.solve(solver=self.solver, warm_start=True, **self.solver_options)
+        elapsed = time.perf_counter() - t0
+        
+        compilation = self.problem.compilation_time or 0.0
+        if self.setup_time is None:
+            self.setup_time = compilation
+        self.solve_time = elapsed - compilation
+        self.status = self.problem.status
+        self.n_solves += 1
+        return self._A.value
+    
+    @property
+    def stats(self):
+        return {'setup_time': self.setup_time, 'solve_time': self.solve_time,
+                'status': self.status, 'n_solves': self.n_solves}
 
-def solve_A_0norm(X, Y):
+def _solveBatch(solve_stack, Xs, Ys):
     """
-    Solve Y = AX for A by minimizing L0-norm using OMP.
+    Apply solve_stack to stacked rooms, grouping rooms by shape.
     
     Args:
-        X: [m, N]
-        Y: [l, N]
+        solve_stack: function of stacked [B, m, N] and [B, l, N] arrays
+            returning [B, l, m]
+        Xs: [B, m, N] array, or a sequence of [m_b, N_b] arrays
+        Ys: [B, l, N] array, or a sequence of [l_b, N_b] arrays
         
     Returns:
-        A: [l, m]
+        As: [B, l, m] array if Xs and Ys are arrays, else a list of [l_b, m_b]
     """
-    m, N = X.shape
-    l = Y.shape[0]
+    if isinstance(Xs, np.ndarray) and isinstance(Ys, np.ndarray):
+        return solve_stack(Xs, Ys)
     
-    # Construct Kronecker product
-    # vec(AX) = (X.T \kron I) vec(A) = vec(Y)
-    # XX = kron(X', eye(l))
-    # In Python, X.T has shape [N, m]. Eye is [l, l].
-    # Kron results in [N*l, m*l].
-    
-    XX = np.kron(X.T, np.eye(l))
-    YY = Y.flatten(order='F') # MATLAB vec(Y) is column-major
-    
-    # Solve strictly speaking: YY = XX @ vec(A)
-    # OMP
-    # We need to pick tolerance or n_nonzero_coefs.
-    # The MATLAB wrapper around SparseLab SolveOMP likely uses a default or max iterations.
-    # checking MATLAB code: AA = SolveOMP(XX, YY, m1 * m2);
-    # m1*m2 is the max cardinality (all atoms). 
-    # If passed as cardinality, it solves exactly? 
-    # But usually OMP is for sparse recovery.
-    # Let's use sklearn OMP.
-    # Sklearn OMP requires `n_nonzero_coefs` or `tol`.
-    # If we want to recover *any* solution, we might as well use lstsq if it's not sparse.
-    # Assuming we want sparse solution.
-    # Since we don't have the param, let's look at what MATLAB code effectively does.
-    # It passes m1*m2 as 'cardinality' (3rd arg). 
-    # In SparseLab, SolveOMP(A, y, k) runs k iterations.
-    # If k = total dimensions, it finds a full solution (dense).
-    # That defeats the purpose of '0norm' optimization if it just runs to completion.
-    # HOWEVER, maybe it stops earlier if residual is 0?
-    
-    # For now, let's assume we want substantial sparsity or good fit.
-    # Let's set tol=None and n_nonzero_coefs=min(m*l, N*l) ? 
-    # Actually, let's try to match behavior: run until residual is small?
-    
-    omp = OrthogonalMatchingPursuit(n_nonzero_coefs=None, tol=1e-6)
-    omp.fit(XX, YY)
-    
-    AA = omp.coef_
-    
-    # Reshape back to A
-    A = AA.reshape((l, m), order='F')
-    return A
+    if len(Xs) != len(Ys):
+        raise ValueError("Xs and Ys must have the same number of rooms")
+    groups = {}
+    for b, (X, Y) in enumerate(zip(Xs, Ys)):
+        groups.setdefault((np.shape(X), np.shape(Y)), []).append(b)
+    
+    As = [None] * len(Xs)
+    for rooms in groups.values():
+        A_stack = solve_stack(np.stack([Xs[b] for b in rooms]), np.stack([Ys[b] for b in rooms]))
+        for b, A in zip(rooms, A_stack):
+            As[b] = A
+    return As
 
-def solve_A_1norm(X, Y):
+@instrument.profiled('ltm.solve_A_fullrank_batch', _batchSizes)
+def solve_A_fullrank_batch(Xs, Ys):
     """
-    Solve Y = AX for A by minimizing L1-norm (Basis Pursuit).
+    solve_A_fullrank for many rooms at once.
+    
+    The minimum-norm least-squares solution A = Y pinv(X) of every room is
+    computed with NumPy's batched pinv and matmul over the leading axis.
+    Rooms of different sizes are grouped by shape, and each group is solved
+    as one batch.
     
     Args:
-        X: [m, N]
-        Y: [l, N]
+        Xs: [B, m, N] stacked inputs, or a sequence of [m_b, N_b] arrays
+        Ys: [B, l, N] stacked outputs, or a sequence of [l_b, N_b] arrays
         
     Returns:
-        A: [l, m]
+        As: [B, l, m] array, or a list of [l_b, m_b] arrays for sequences
     """
-    m, N = X.shape
-    l = Y.shape[0]
+    return _solveBatch(lambda X, Y: Y @ np.linalg.pinv(X), Xs, Ys)
+
+@instrument.profiled('ltm.solve_A_Fnorm_batch', _batchSizes)
+def solve_A_Fnorm_batch(Xs, Ys, threshold=0.01):
+    """
+    solve_A_Fnorm for many rooms at once.
+    
+    Uses NumPy's batched thin SVD over the leading axis. Singular values
+    of X below threshold are dropped, as in solve_A_Fnorm. Rooms of
+    different sizes are grouped by shape, and each group is solved as one
+    batch.
+    
+    Args:
+        Xs: [B, m, N] stacked inputs, or a sequence of [m_b, N_b] arrays
+        Ys: [B, l, N] stacked outputs, or a sequence of [l_b, N_b] arrays
+        threshold: singular values of X at or below it are discarded
+        
+    Returns:
+        As: [B, l, m] array, or a list of [l_b, m_b] arrays for sequences
+    """
+    def solve_stack(X, Y):
+        U, s, Vt = np.linalg.svd(X, full_matrices=False)
+        s_inv = np.zeros_like(s)
+        np.divide(1.0, s, out=s_inv, where=s > threshold)
+        # A = Y V diag(1/s) U.T over the kept singular values
+        return ((Y @ np.swapaxes(Vt, -1, -2)) * s_inv[..., np.newaxis, :]) @ np.swapaxes(U, -1, -2)
     
-    XX = np.kron(X.T, np.eye(l))
-    YY = Y.flatten(order='F')
+    return _solveBatch(solve_stack, Xs, Ys)
+
+class StreamingLTM:
+    """
+    Streaming estimate of A in Y = AX, updated one perturbation at a time.
     
-    # Define variable (flattened A)
-    n_vars = m * l
-    a_vec = cp.Variable(n_vars)
+    Recursive least squares: the state is the current A and the inverse
+    P = (lambda^N delta I + sum_k lambda^(N-k) x_k x_k.T)^-1 of the
+    (regularized, exponentially weighted) X X.T. Each update(x, y) is a
+    rank-one correction of both, costing O(m^2 + l*m) instead of a new
+    least-squares solve over the whole history. With forgetting = 1 and a
+    small regularization, A matches solve_A_fullrank on the same pairs once
+    X has full row rank.
     
-    # Minimize L1 norm subject to XX @ a_vec == YY
-    objective = cp.Minimize(cp.norm(a_vec, 1))
-    constraints = [XX @ a_vec == YY]
+    Args:
+        m: number of perturbation channels (rows of X)
+        l: number of sensor channels (rows of Y)
+        forgetting: factor lambda in (0, 1] that down-weights older pairs,
+            so that A tracks changes in the room. 1 weighs all pairs equally.
+        regularization: delta, the ridge added to X X.T before any update
+        
+    Attributes:
+        A: [l, m] current estimate
+        n_updates: number of pairs seen
+    """
+    
+    def __init__(self, m, l, forgetting=1.0, regularization=1e-6):
+        if not 0 < forgetting <= 1:
+            raise ValueError("forgetting must be in (0, 1]")
+        self.m = m
+        self.l = l
+        self.forgetting = forgetting
+        self.regularization = regularization
+        self.A = np.zeros((l, m))
+        self.P = np.eye(m) / regularization
+        self.n_updates = 0
+    
+    def fit(self, X, Y):
+        """
+        Reset the state to the batch solution over the pairs (X, Y).
+        
+        Args:
+            X: [m, N]
+            Y: [l, N]
+        """
+        N = X.shape[1]
+        lam = self.forgetting
+        weights = lam ** np.arange(N - 1, -1, -1)
+        Gram = (X * weights) @ X.T + lam**N * self.regularization * np.eye(self.m)
+        self.P = scipy.linalg.inv(Gram)
+        self.P = 0.5 * (self.P + self.P.T)
+        self.A = ((Y * weights) @ X.T) @ self.P
+        self.n_updates = N
+        return self
+    
+    @instrument.profiled('ltm.StreamingLTM.update')
+    def update(self, x, y):
+        """
+        Add one perturbation pair.
+        
+        Args:
+            x: [m] perturbation
+            y: [l] sensor response
+            
+        Returns:
+            A: [l, m] updated estimate
+        """
+        x = np.asarray(x, dtype=np.float64).reshape(self.m)
+        y = np.asarray(y, dtype=np.float64).reshape(self.l)
+        
+        Px = self.P @ x
+        denominator = self.forgetting + x @ Px
+        error = y - self.A @ x
+        
+        self.A += np.outer(error, Px / denominator)
+        # P is symmetric, so x.T @ P = Px.T. Downdating with the exactly
+        # symmetric outer(Px, Px) keeps it symmetric in floating point;
+        # otherwise the asymmetry grows by 1 / forgetting at every step.
+        self.P -= np.outer(Px, Px) / denominator
+        if self.forgetting != 1:
+            self.P /= self.forgetting
+        
+        self.n_updates += 1
+        return self.A
+    
+    @instrument.profiled('ltm.StreamingLTM.updateBatch')
+    def updateBatch(self, X, Y):
+        """
+        Add the pairs (X[:, k], Y[:, k]) in order.
+        
+        Args:
+            X: [m, N]
+            Y: [l, N]
+            
+        Returns:
+            A: [l, m] updated estimate
+        """
+        for k in range(X.shape[1]):
+            self.update(X[:, k], Y[:, k])
+        return self.A
+
+class _RowProblem:
+    """
+    X shared by the row problems of one solve, with its Gram matrix and
+    basis pursuit program, built on first use.
+    """
+    
+    def __init__(self, X):
+        self.X = X
+        self.Gram = None
+        self.bp = None
+
+# Row problem of the current worker process, set by _initWorker
+_worker_problem = None
+_worker_shm = None
+
+def _initWorker(shm_name, shape, dtype):
+    """
+    Attach a worker process to the shared-memory copy of X.
+    """
+    global _worker_problem, _worker_shm
+    if shm_name is None:
+        return
+    # Pool workers share the resource tracker of the parent, which owns the
+    # segment and unlinks it once all tasks are done.
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_problem = _RowProblem(np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf))
+
+def _solveRow(kind, problem, y, options):
+    """
+    Solve X.T @ a = y for one row a of A, with X from problem.
+    
+    Returns:
+        a: [m] row of A
+        info: dict with 'time', 'converged', 'status', 'residual' and 'nnz'
+    """
+    X = problem.X
+    t0 = time.perf_counter()
+    
+    if kind == '0norm':
+        if problem.Gram is None:
+            problem.Gram = X @ X.T
+        norm_sq = np.dot(y, y)
+        with warnings.catch_warnings():
+            # Reported through 'converged' instead
+            warnings.simplefilter('ignore', RuntimeWarning)
+            a = orthogonal_mp_gram(problem.Gram, (X @ y)[:, np.newaxis], tol=options['tol'],
+                                   norms_squared=np.array([norm_sq]))
+        a = np.asarray(a).reshape(X.shape[0])
+        residual = np.linalg.norm(a @ X - y)
+        converged = residual**2 <= options['tol'] * (1 + 1e-6) + 1e-12
+        status = 'optimal' if converged else 'linear_dependence'
+    else:
+        # One single-row program per problem, compiled once and re-solved
+        if problem.bp is None:
+            problem.bp = BasisPursuitSolver(X, 1, solver=options['solver'], tol=options['tol'])
+        a = problem.bp.solve(y[np.newaxis, :])
+        status = problem.bp.status
+        converged = status == cp.OPTIMAL
+        a = a[0] if a is not None else np.full(X.shape[0], np.nan)
+        residual = np.linalg.norm(a @ X - y)
+    
+    info = {'time': time.perf_counter() - t0, 'converged': bool(converged),
+            'status': status, 'residual': float(residual),
+            'nnz': int(np.count_nonzero(np.abs(a) > 1e-9))}
+    return a, info
+
+def _solveRowBlock(kind, rows, Y_block, options, problem=None):
+    """
+    Solve a block of rows, see _solveRow. Without a problem, the one of the
+    worker process is used.
+    """
+    if problem is None:
+        problem = _worker_problem
+    results = []
+    for i, y in zip(rows, Y_block):
+        a, info = _solveRow(kind, problem, y, options)
+        info['row'] = int(i)
+        results.append((a, info))
+    return results
+
+def _solveRows(kind, X, Y, n_jobs, return_info, **options):
+    """
+    Solve Y = AX one row of A at a time, in a process pool when n_jobs > 1.
+    
+    The rows of vec(AX) = vec(Y) are independent problems sharing X, so
+    blocks of rows are dispatched to the workers. X is copied once into
+    shared memory that every worker maps, instead of being pickled with
+    each task.
+    
+    Returns:
+        A: [l, m]
+        info: (if return_info) list with one dict per row: 'row', 'time'
+              (seconds), 'converged', 'status', 'residual' (norm of the
+              row residual) and 'nnz' (number of nonzeros)
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    l = Y.shape[0]
     
-    prob = cp.Problem(objective, constraints)
-    prob.solve()
+    if n_jobs is None:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(min(int(n_jobs), l), 1)
     
-    AA = a_vec.value
-    A = AA.reshape((l, m), order='F')
+    if n_jobs == 1:
+        results = _solveRowBlock(kind, range(l), Y, options, _RowProblem(X))
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+            # About 4 blocks per worker for load balancing
+            blocks = np.array_split(np.arange(l), min(4 * n_jobs, l))
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=n_jobs, initializer=_initWorker,
+                    initargs=(shm.name, X.shape, X.dtype.str)) as executor:
+                futures = [executor.submit(_solveRowBlock, kind, rows, Y[rows], options)
+                           for rows in blocks]
+                results = [r for future in futures for r in future.result()]
+        finally:
+            shm.close()
+            shm.unlink()
     
+    A = np.vstack([a for a, _ in results])
+    if return_info:
+        return A, [info for _, info in results]
     return A
@@ -0,0 +1,147 @@
+import queue
+import threading
+
+import numpy as np
+
+from . import blockage
+from . import ltm
+from .io import perturbationPair
+
+def differenceFrames(frames):
+    """
+    Stage 1: yield the (X, Y) pair of every measurement frame.
+    """
+    for frame in frames:
+        yield perturbationPair(frame)
+
+def recoverLTMs(pairs, solver=ltm.solve_A_fullrank):
+    """
+    Stage 2: yield the LTM A recovered from every (X, Y) pair.
+
+    Args:
+        pairs: iterable of (X, Y)
+        solver: function of (X, Y) returning A, e.g. ltm.solve_A_fullrank
+    """
+    for X, Y in pairs:
+        yield solver(X, Y)
+
+def differenceLTMs(As, A0):
+    """
+    Stage 3: yield E = A0 - A, clipped at zero, for every LTM A.
+    """
+    for A in As:
+        E = A0 - A
+        np.maximum(E, 0, out=E)
+        yield E
+
+def renderVolumes(Es, renderer, double_buffer=False):
+    """
+    Stage 4: yield the volume rendered from every difference matrix E (or
+    its floor map or region scores, if the renderer has a projection).
+
+    Args:
+        Es: iterable of difference matrices
+        renderer: blockage.BlockageRenderer or blockage.CoarseToFineRenderer
+        double_buffer: render into two preallocated volumes in turn instead
+            of a new array per frame. A yielded volume is then overwritten
+            two frames later, so consumers must copy volumes they keep.
+    """
+    if not double_buffer:
+        for E in Es:
+            yield renderer.render(E)
+        return
+
+    buffers = [np.empty(renderer.output_shape, dtype=renderer.dtype, order='F') for _ in range(2)]
+    for i, E in enumerate(Es):
+        yield renderer.render(E, out=buffers[i % 2])
+
+_END = object()
+
+def prefetch(iterable, depth=2):
+    """
+    Iterate over iterable in a background thread, keeping at most depth
+    items ready ahead of the consumer.
+
+    This overlaps an upstream stage (e.g. reading sensors or solving LTMs)
+    with the downstream ones while bounding memory to depth items.
+    Exceptions raised upstream are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=max(int(depth), 1))
+    stop = threading.Event()
+
+    def put(entry):
+        # Give up once the consumer has stopped, so that a full queue never
+        # blocks the producer for good
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as error:
+            put((_END, error))
+
+    thread = threading.Thread(target=produce, name='cosbos-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Let the producer exit if the consumer stops early
+        stop.set()
+
+def occupancyPipeline(frames, base_frame, sensors, lights, dim, sigma,
+                      solver=ltm.solve_A_fullrank, renderer=None,
+                      prefetch_depth=0, double_buffer=False, **renderer_options):
+    """
+    Streaming Python counterpart of demo_Blockage.m.
+
+    The baseline LTM A0 (empty room) and the blockage renderer are computed
+    once. Every measurement frame then goes through differencing, LTM
+    recovery, E = max(A0 - A, 0) and rendering, one frame at a time, so
+    memory stays bounded however long the stream is.
+
+    Args:
+        frames: iterable of measurement frames, (TestLight, cdata) tuples or
+            dicts with these keys, e.g. live sensor readings
+        base_frame: measurement frame of the empty room
+        sensors: [N, 3] coordinates
+        lights: [M, 3] coordinates
+        dim: [dim_x, dim_y, dim_z]
+        sigma: scalar
+        solver: function of (X, Y) returning A
+        renderer: optional prebuilt blockage.BlockageRenderer (or
+            CoarseToFineRenderer) for this geometry
+        prefetch_depth: if > 0, frames are read and LTMs recovered in a
+            background thread, at most this many frames ahead of rendering
+        double_buffer: see renderVolumes
+        renderer_options: passed to blockage.BlockageRenderer
+
+    Yields:
+        V: [nx, ny, nz] volume of each frame, or its projection if
+            renderer_options has one (see blockage.BlockageRenderer)
+    """
+    X0, Y0 = perturbationPair(base_frame)
+    A0 = solver(X0, Y0)
+
+    if renderer is None:
+        renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma, **renderer_options)
+
+    As = recoverLTMs(differenceFrames(frames), solver)
+    if prefetch_depth > 0:
+        As = prefetch(As, prefetch_depth)
+
+    yield from renderVolumes(differenceLTMs(As, A0), renderer, double_buffer)
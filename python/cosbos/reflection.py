@@ -1,6 +1,122 @@
 import numpy as np
 from scipy.interpolate import PchipInterpolator
 
+from . import instrument
+
+class FixtureProfile:
+    """
+    Luminous intensity distribution of a light fixture.
+    
+    The distribution is given as samples of the intensity at angles (in
+    degrees) from the normal direction, and interpolated with PCHIP as in
+    MATLAB's interp1(..., 'pchip'). Calling the profile looks up a dense
+    table of the PCHIP curve, precomputed at most every `resolution` degrees
+    (the step is shortened so that it divides the sampled range), with
+    linear interpolation, which is much cheaper than evaluating the PCHIP.
+    Use exact() for the PCHIP itself, and maxError() for the accuracy of
+    the table.
+    
+    Args:
+        angles: increasing sample angles in degrees
+        intensity: luminous intensity at each angle
+        resolution: spacing of the lookup table in degrees
+    """
+    
+    def __init__(self, angles, intensity, resolution=0.05):
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.intensity = np.asarray(intensity, dtype=np.float64)
+        self.resolution = float(resolution)
+        self._interpolator = PchipInterpolator(self.angles, self.intensity)
+        
+        # Table over [angles[0], angles[-1]] with n - 1 equal cells, indexed
+        # directly in radians
+        span = self.angles[-1] - self.angles[0]
+        n = int(np.ceil(span / self.resolution)) + 1
+        step = span / (n - 1)
+        table_deg = np.linspace(self.angles[0], self.angles[-1], n)
+        self._theta0 = self.angles[0] * np.pi / 180
+        self._inv_step = 180 / (np.pi * step)
+        self._table = self._interpolator(table_deg)
+        self._slope = np.append(np.diff(self._table), 0.0)
+    
+    def exact(self, theta):
+        """
+        PCHIP interpolation of the samples.
+        
+        Args:
+            theta: angle to normal direction (in radians)
+            
+        Returns:
+            Iq: luminous intensity
+        """
+        theta_deg = theta * 180 / np.pi
+        return self._interpolator(theta_deg)
+    
+    def __call__(self, theta):
+        """
+        Table lookup of the distribution. Angles outside the sampled range
+        are clamped to it.
+        
+        Args:
+            theta: angle to normal direction (in radians)
+            
+        Returns:
+            Iq: luminous intensity
+        """
+        theta = np.asarray(theta, dtype=np.float64)
+        pos = (theta.reshape(-1) - self._theta0) * self._inv_step
+        np.clip(pos, 0, self._table.shape[0] - 1, out=pos)
+        idx = pos.astype(np.intp)
+        pos -= idx
+        return (self._table[idx] + pos * self._slope[idx]).reshape(theta.shape)
+    
+    def maxError(self, num_samples=100001):
+        """
+        Largest absolute difference between the table lookup and the exact
+        PCHIP, over num_samples angles evenly spread over the sampled range.
+        """
+        theta = np.linspace(self.angles[0], self.angles[-1], num_samples) * np.pi / 180
+        return np.max(np.abs(self(theta) - self.exact(theta)))
+
+_FIXTURE_PROFILES = {}
+
+def registerFixtureProfile(name, profile):
+    """
+    Register a FixtureProfile under a name, so that it can be passed by
+    name as the profile of the reflection kernels.
+    """
+    if not isinstance(profile, FixtureProfile):
+        raise TypeError("profile must be a FixtureProfile")
+    _FIXTURE_PROFILES[name] = profile
+
+def unregisterFixtureProfile(name):
+    """
+    Remove a FixtureProfile registered by registerFixtureProfile.
+    """
+    try:
+        del _FIXTURE_PROFILES[name]
+    except KeyError:
+        raise KeyError("unknown fixture profile %r" % name) from None
+
+def getFixtureProfile(name):
+    """
+    Look up a registered FixtureProfile by name.
+    """
+    try:
+        return _FIXTURE_PROFILES[name]
+    except KeyError:
+        raise KeyError("unknown fixture profile %r, registered: %s"
+                       % (name, sorted(_FIXTURE_PROFILES))) from None
+
+# The Vivia 7DR3-RGB fixture (from Renaissance Lighting), sampled every 5
+# degrees from the normal direction. lightDistribution and the default
+# kernels use this object directly, so changes to the registry never alter
+# them.
+_VIVIA = FixtureProfile(
+    np.arange(0, 95, 5), # 0 to 90 inclusive
+    [509, 505, 456, 398, 333, 269, 203, 142, 91, 49, 15, 1, 0, 0, 0, 0, 0, 0, 0])
+registerFixtureProfile('vivia_7dr3_rgb', _VIVIA)
+
 def lightDistribution(theta):
     """
     The luminous intensity distribution of our Vivia 7DR3-RGB fixture.
@@ -11,16 +127,22 @@ def lightDistribution(theta):
     Returns:
         Iq: luminous intensity
     """
-    a = np.arange(0, 95, 5) # 0 to 90 inclusive
-    I = np.array([509, 505, 456, 398, 333, 269, 203, 142, 91, 49, 15, 1, 0, 0, 0, 0, 0, 0, 0])
-    
-    # Octave's interp1 with 'pchip' is PchipInterpolator in scipy
-    interpolator = PchipInterpolator(a, I)
-    
-    theta_deg = theta * 180 / np.pi
-    return interpolator(theta_deg)
+    return _VIVIA.exact(theta)
 
-def getReflectionKernel(light, sensor, dim, para):
+def _intensity(theta, profile):
+    """
+    Intensity at theta: the exact Vivia distribution if profile is None,
+    otherwise the table lookup of a FixtureProfile or registered name.
+    """
+    if profile is None:
+        return lightDistribution(theta)
+    if isinstance(profile, str):
+        profile = getFixtureProfile(profile)
+    return profile(theta)
+
+@instrument.profiled('reflection.getReflectionKernel',
+                     lambda light, sensor, dim, *args, **kwargs: {'pixels': int(dim[0]) * int(dim[1])})
+def getReflectionKernel(light, sensor, dim, para, profile=None):
     """
     Compute the reflection kernel for one sensor-fixture pair.
     
@@ -29,6 +151,8 @@ def getReflectionKernel(light, sensor, dim, para):
         sensor: 3D spatial coordinates of the sensor [x, y, z]
         dim: 3D dimension of the room [dim_x, dim_y, dim_z]
         para: Reflection model parameter (0: non-Lambertian, 1: Lambertian)
+        profile: optional FixtureProfile (or registered name) whose lookup
+            table replaces the exact Vivia distribution
         
     Returns:
         K: The resulting reflection kernel (2D matrix of size dim[0] x dim[1])
@@ -62,7 +186,7 @@ def getReflectionKernel(light, sensor, dim, para):
     theta1 = np.arccos(cos1)
     
     # 6. Luminous Intensity calculation
-    Iq = lightDistribution(theta1)
+    Iq = _intensity(theta1, profile)
     
     # 7. Final Kernel calculation
     v = Iq * cos1 * cos2 / (D1**2) / (D2**2)
@@ -72,3 +196,146 @@ def getReflectionKernel(light, sensor, dim, para):
         v = v * cos2
         
     return v
+
+def _lightTerms(lights, X, Y, profile=None):
+    """
+    Factor of the reflection kernel that depends only on the light:
+    Iq * cos1 / D1^2, for every light.
+    
+    Returns:
+        [nl, X.shape[0], X.shape[1]] array
+    """
+    lx = lights[:, 0, np.newaxis, np.newaxis]
+    ly = lights[:, 1, np.newaxis, np.newaxis]
+    lz = lights[:, 2, np.newaxis, np.newaxis]
+    
+    D1_sq = (lx - X)**2 + (ly - Y)**2 + lz**2
+    cos1 = lz / np.sqrt(D1_sq)
+    Iq = _intensity(np.arccos(cos1), profile)
+    return Iq * cos1 / D1_sq
+
+def _sensorTerms(sensors, X, Y, para):
+    """
+    Factor of the reflection kernel that depends only on the sensor:
+    cos2 / D2^2, times cos2 again for the Lambertian model, for every sensor.
+    
+    Returns:
+        [ns, X.shape[0], X.shape[1]] array
+    """
+    sx = sensors[:, 0, np.newaxis, np.newaxis]
+    sy = sensors[:, 1, np.newaxis, np.newaxis]
+    sz = sensors[:, 2, np.newaxis, np.newaxis]
+    
+    D2_sq = (sx - X)**2 + (sy - Y)**2 + sz**2
+    cos2 = sz / np.sqrt(D2_sq)
+    v = cos2 / D2_sq
+    
+    # Lambertian correction
+    if para == 1:
+        v = v * cos2
+    return v
+
+@instrument.profiled('reflection.getReflectionKernels',
+                     lambda lights, sensors, dim, *args, **kwargs: {
+                         'pixels': int(dim[0]) * int(dim[1]), 'pairs': len(lights) * len(sensors)})
+def getReflectionKernels(lights, sensors, dim, para, dtype=np.float64, chunk_size=None,
+                         profile=None):
+    """
+    Compute the reflection kernels for all sensor-fixture pairs at once.
+    
+    The kernel of getReflectionKernel factors into a term that depends only
+    on the light and a term that depends only on the sensor. Both are
+    computed once per light and per sensor, and the kernels are their
+    products, so the cost of the transcendental functions grows with
+    ns + nl instead of ns * nl.
+    
+    Unlike generateAllKernels.m, the y axis is not mirrored, so that
+    K[s, l] equals getReflectionKernel(lights[l], sensors[s], dim, para).
+    
+    Args:
+        lights: [M, 3] coordinates of the light fixtures
+        sensors: [N, 3] coordinates of the sensors
+        dim: 3D dimension of the room [dim_x, dim_y, dim_z]
+        para: Reflection model parameter (0: non-Lambertian, 1: Lambertian)
+        dtype: dtype of the returned kernels (e.g. np.float32 for large
+            floor plans). Terms are computed in float64.
+        chunk_size: optional number of grid rows (x) computed at a time, to
+            bound the temporaries for large floor plans
+        profile: optional FixtureProfile (or registered name) whose lookup
+            table replaces the exact Vivia distribution
+        
+    Returns:
+        K: [N, M, dim_x, dim_y] array, K[s, l] the kernel of sensor s and light l
+    """
+    lights = np.asarray(lights, dtype=np.float64).reshape(-1, 3)
+    sensors = np.asarray(sensors, dtype=np.float64).reshape(-1, 3)
+    nx, ny = int(dim[0]), int(dim[1])
+    
+    K = np.empty((sensors.shape[0], lights.shape[0], nx, ny), dtype=dtype)
+    
+    # Same 1-based grid as getReflectionKernel
+    y_range = np.arange(1, ny + 1)[np.newaxis, :]
+    chunk_size = nx if chunk_size is None else max(int(chunk_size), 1)
+    for x0 in range(0, nx, chunk_size):
+        x1 = min(x0 + chunk_size, nx)
+        x_range = np.arange(x0 + 1, x1 + 1)[:, np.newaxis]
+        
+        light_terms = _lightTerms(lights, x_range, y_range, profile)
+        sensor_terms = _sensorTerms(sensors, x_range, y_range, para)
+        np.multiply(sensor_terms[:, np.newaxis], light_terms[np.newaxis, :],
+                    out=K[:, :, x0:x1, :])
+    
+    return K
+
+@instrument.profiled('reflection.floorFromReflection',
+                     lambda E, kernels, *args, **kwargs: {'kernel_shape': tuple(kernels.shape)})
+def floorFromReflection(E, kernels, lambda1=1, lambda2=1, kernel_sum=None):
+    """
+    Floor-plane occupancy map of the reflection model (Eq. 16 in [1]).
+    
+    Python counterpart of Step 3 of demo_Reflection.m. The LTM change of
+    each sensor-light pair, a(s, l) = E(4s, 3l) + E(4s+1, 3l+1) + E(4s+2, 3l+2),
+    weights the kernel of that pair:
+    
+        C = sum_{s,l} a(s, l)^lambda1 * K[s, l] / (sum_{s,l} K[s, l])^lambda2
+    
+    All frames of a batch are aggregated with one matrix product. The kernel
+    sum depends only on the kernels; pass it as kernel_sum to avoid
+    recomputing it on every call.
+    
+    Args:
+        E: [4*N, 3*M] difference matrix E = A0 - A (or its column-major flat
+           form), or a stack [T, 4*N, 3*M] of them
+        kernels: [N, M, dim_x, dim_y] kernels from getReflectionKernels.
+            demo_Reflection.m mirrors the y axis of its kernels, so mirror
+            the map (C[:, ::-1]) to compare with it.
+        lambda1: exponent of the LTM change
+        lambda2: exponent of the kernel sum
+        kernel_sum: optional precomputed kernels.sum(axis=(0, 1)), [dim_x, dim_y]
+        
+    Returns:
+        C: [dim_x, dim_y] occupancy map, or [T, dim_x, dim_y] for a stack
+    """
+    ns, nl, nx, ny = kernels.shape
+    E = np.asarray(E)
+    if E.ndim == 1:
+        E = E.reshape((4 * ns, 3 * nl), order='F')
+    
+    # [..., ns, nl] weights of the sensor-light pairs
+    a = E[..., 0::4, 0::3] + E[..., 1::4, 1::3] + E[..., 2::4, 2::3]
+    if lambda1 != 1:
+        a = a ** lambda1
+    
+    K_mat = kernels.reshape((ns * nl, nx * ny))
+    C = a.reshape(a.shape[:-2] + (ns * nl,)) @ K_mat
+    
+    if kernel_sum is None:
+        denominator = K_mat.sum(axis=0)
+    else:
+        denominator = np.asarray(kernel_sum).reshape(nx * ny)
+    if lambda2 != 1:
+        denominator = denominator ** lambda2
+    np.divide(C, denominator, out=C, where=denominator != 0)
+    C[..., denominator == 0] = 0
+    
+    return C.reshape(a.shape[:-2] + (nx, ny))
@@ -1,5 +1,7 @@
+import concurrent.futures
 import numpy as np
 import scipy.io
+import scipy.sparse
 import os
 import pytest
 from cosbos import blockage
@@ -24,6 +26,18 @@ def test_hashGaussians(ground_truth):
     # Verify
     np.testing.assert_allclose(H_pred, H_true, rtol=1e-5, atol=1e-8)
 
+def test_hashGaussians_tube(ground_truth):
+    sensors = ground_truth['sensors_blockage']
+    lights = ground_truth['lights_blockage']
+    dim = ground_truth['dim'].flatten()
+    sigma = ground_truth['sigma'].item()
+    
+    H_true = ground_truth['H'].flatten()
+    
+    H_pred = blockage.hashGaussians(sensors, lights, dim, sigma, method='tube')
+    
+    np.testing.assert_allclose(H_pred, H_true, rtol=1e-5, atol=1e-8)
+
 def test_volumeFromHashing(ground_truth):
     sensors = ground_truth['sensors_blockage']
     lights = ground_truth['lights_blockage']
@@ -38,3 +52,297 @@ def test_volumeFromHashing(ground_truth):
     
     # Verify
     np.testing.assert_allclose(V_pred, V_true, rtol=1e-5, atol=1e-8)
+
+@pytest.fixture
+def synthetic_geometry():
+    # Small random room so the tests run without ground_truth.mat
+    rng = np.random.default_rng(0)
+    dim = np.array([11, 13, 9])
+    sensors = rng.uniform(0, 10, size=(3, 3))
+    lights = rng.uniform(0, 10, size=(4, 3))
+    E = rng.uniform(size=(4 * 3, 3 * 4))
+    return sensors, lights, dim, 3.0, E
+
+def test_pointToLineDistance():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 10, size=(50, 3))
+    starts = rng.uniform(0, 10, size=(7, 3))
+    ends = rng.uniform(0, 10, size=(7, 3))
+    ends[3] = starts[3] # zero length
+    
+    d = ends - starts
+    v = points[:, np.newaxis, :] - starts[np.newaxis, :, :]
+    cross = np.linalg.norm(np.cross(v, d[np.newaxis]), axis=2)
+    length = np.linalg.norm(d, axis=1)
+    expected_line = cross / np.where(length == 0, 1, length)
+    expected_line[:, 3] = np.linalg.norm(v[:, 3], axis=1)
+    
+    dist = blockage.pointToLineDistance(points, starts, ends)
+    assert dist.shape == (50, 7)
+    np.testing.assert_allclose(dist, expected_line, rtol=1e-10, atol=1e-10)
+    
+    # Segments: nearest point clamped to the endpoints
+    t = np.clip(np.einsum('plk,lk->pl', v, d) / np.maximum(length**2, 1e-10), 0, 1)
+    expected_segment = np.linalg.norm(v - t[..., np.newaxis] * d[np.newaxis], axis=2)
+    np.testing.assert_allclose(blockage.pointToLineDistance(points, starts, ends, segment=True),
+                               expected_segment, rtol=1e-10, atol=1e-10)
+    
+    # Squared, in blocks, into a buffer
+    out = np.empty((50, 7))
+    result = blockage.pointToLineDistance(points, starts, ends, squared=True, out=out, block_size=8)
+    assert result is out
+    np.testing.assert_array_equal(out, blockage.pointToLineDistance(points, starts, ends, squared=True))
+    np.testing.assert_allclose(np.sqrt(out), dist, rtol=1e-12)
+    
+    with pytest.raises(ValueError):
+        blockage.pointToLineDistance(points, starts, ends, out=np.empty((7, 50)))
+
+def test_hashGaussians_chunked(synthetic_geometry):
+    sensors, lights, dim, sigma, _ = synthetic_geometry
+    H_full = blockage.hashGaussians(sensors, lights, dim, sigma)
+    
+    # A tiny budget forces one voxel per block
+    for max_memory in [1, 10000]:
+        H_chunked = blockage.hashGaussians(sensors, lights, dim, sigma, max_memory=max_memory)
+        np.testing.assert_array_equal(H_chunked, H_full)
+
+def test_hashGaussians_cutoff(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H_full = blockage.hashGaussians(sensors, lights, dim, sigma)
+    H_sparse = blockage.hashGaussians(sensors, lights, dim, sigma, max_memory=10000, cutoff=4)
+    
+    assert scipy.sparse.issparse(H_sparse)
+    assert H_sparse.shape == (np.prod(dim), 12)
+    
+    # Dropped weights are below exp(-4^2 / 2)
+    np.testing.assert_allclose(H_sparse.toarray().flatten('F'), H_full, atol=np.exp(-8))
+    
+    V_full = blockage.volumeFromHashing(sensors, lights, dim, H_full, E.flatten('F'))
+    V_sparse = blockage.volumeFromHashing(sensors, lights, dim, H_sparse, E.flatten('F'))
+    np.testing.assert_allclose(V_sparse, V_full, atol=1e-3)
+
+def test_volumesFromHashing(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    Es = np.stack([E, 2 * E, np.zeros_like(E)])
+    
+    V_batch = blockage.volumesFromHashing(sensors, lights, dim, H, Es)
+    assert V_batch.shape == (3,) + tuple(dim)
+    
+    for E_t, V_t in zip(Es, V_batch):
+        V_single = blockage.volumeFromHashing(sensors, lights, dim, H, E_t.flatten('F'))
+        np.testing.assert_allclose(V_t, V_single, rtol=1e-12, atol=1e-12)
+
+def test_volumeFromHashing_inplace_update(synthetic_geometry):
+    # A buffer refilled in place must not be normalized by stale row sums
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    blockage.volumeFromHashing(sensors, lights, dim, H, E.flatten('F'))
+    
+    H[:int(np.prod(dim))] *= 2  # the Gaussians of the first line
+    V = blockage.volumeFromHashing(sensors, lights, dim, H, E.flatten('F'))
+    V_copy = blockage.volumeFromHashing(sensors, lights, dim, H.copy(), E.flatten('F'))
+    np.testing.assert_array_equal(V, V_copy)
+    np.testing.assert_array_equal(blockage.volumesFromHashing(sensors, lights, dim, H, E[np.newaxis])[0],
+                                  blockage.volumesFromHashing(sensors, lights, dim, H.copy(), E[np.newaxis])[0])
+
+def test_lineWeights(synthetic_geometry):
+    sensors, lights, _, _, E = synthetic_geometry
+    ns, nl = sensors.shape[0], lights.shape[0]
+    
+    # Direct transcription of the loop in volumeFromHashing.cpp
+    L_true = np.zeros(ns * nl)
+    for sc in range(4 * ns):
+        for lc in range(3 * nl):
+            if sc % 4 == lc % 3:
+                L_true[sc // 4 + (lc // 3) * ns] += E[sc, lc]
+    
+    np.testing.assert_allclose(blockage.lineWeights(E, ns, nl), L_true)
+    np.testing.assert_allclose(blockage.lineWeights(E.flatten('F'), ns, nl), L_true)
+    np.testing.assert_allclose(blockage.lineWeights(E[np.newaxis], ns, nl), L_true[np.newaxis])
+
+def test_BlockageRenderer(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    V_true = blockage.volumeFromHashing(sensors, lights, dim, H, E.flatten('F'))
+    
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma)
+    np.testing.assert_allclose(renderer.render(E), V_true, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(renderer.renderBatch(E[np.newaxis])[0], V_true, rtol=1e-12, atol=1e-12)
+    
+    out = np.empty(tuple(dim), order='F')
+    assert renderer.render(E.flatten('F'), out=out) is out
+    np.testing.assert_allclose(out, V_true, rtol=1e-12, atol=1e-12)
+    
+    with pytest.raises(ValueError):
+        renderer.render(E, out=np.empty(tuple(dim)))
+
+def test_BlockageRenderer_threads(synthetic_geometry):
+    # One renderer shared by threads rendering different frames
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma)
+    Es = [E * (t + 1) + t for t in range(8)]
+    expected = [renderer.render(E_t) for E_t in Es]
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(20):
+            for V, V_expected in zip(executor.map(renderer.render, Es), expected):
+                np.testing.assert_array_equal(V, V_expected)
+
+def test_BlockageRenderer_float32(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    V_true = blockage.volumeFromHashing(sensors, lights, dim, H, E.flatten('F'))
+    
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma, dtype=np.float32, H=H)
+    assert renderer.operator.dtype == np.float32
+    V = renderer.render(E)
+    assert V.dtype == np.float32
+    np.testing.assert_allclose(V, V_true, rtol=1e-5, atol=1e-6)
+    
+    # The precomputed H is left untouched
+    np.testing.assert_array_equal(H, blockage.hashGaussians(sensors, lights, dim, sigma))
+
+def test_hashGaussians_float32(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H64 = blockage.hashGaussians(sensors, lights, dim, sigma)
+    
+    # Weights are evaluated in float64 and rounded on store
+    H32 = blockage.hashGaussians(sensors, lights, dim, sigma, max_memory=10000, dtype=np.float32)
+    assert H32.dtype == np.float32
+    np.testing.assert_array_equal(H32, H64.astype(np.float32))
+    for method in ['dense', 'tube']:
+        H_sparse = blockage.hashGaussians(sensors, lights, dim, sigma, cutoff=4, method=method,
+                                          dtype=np.float32)
+        assert H_sparse.dtype == np.float32
+    
+    # Float32 end to end stays within test tolerance of the float64 volume
+    V64 = blockage.volumeFromHashing(sensors, lights, dim, H64, E.flatten('F'))
+    V32 = blockage.volumeFromHashing(sensors, lights, dim, H32, E.flatten('F'))
+    assert V32.dtype == np.float32
+    np.testing.assert_allclose(V32, V64, rtol=1e-5, atol=1e-6)
+    
+    V_batch = blockage.volumesFromHashing(sensors, lights, dim, H32, E[np.newaxis])
+    assert V_batch.dtype == np.float32
+    np.testing.assert_allclose(V_batch[0], V64, rtol=1e-5, atol=1e-6)
+    
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma, dtype=np.float32)
+    np.testing.assert_allclose(renderer.render(E), V64, rtol=1e-5, atol=1e-6)
+
+def test_BlockageRenderer_projection(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    nx, ny, nz = dim
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma)
+    V = renderer.render(E)
+    
+    # Floor maps are sum(V, 3), as in demo_Blockage.m
+    for options in [{}, {'max_memory': 1}, {'n_jobs': 2}, {'cutoff': 4},
+                    {'H': blockage.hashGaussians(sensors, lights, dim, sigma)}]:
+        floor = blockage.BlockageRenderer(sensors, lights, dim, sigma, projection='floor', **options)
+        assert floor.operator.shape == (nx * ny, 12)
+        expected = V.sum(axis=2)
+        if 'cutoff' in options:
+            expected = blockage.BlockageRenderer(sensors, lights, dim, sigma, cutoff=4).render(E).sum(axis=2)
+        np.testing.assert_allclose(floor.render(E), expected, rtol=1e-12, atol=1e-12)
+    
+    # Region masks, floor regions (all heights) or 3D
+    masks = np.zeros((2, nx, ny), dtype=bool)
+    masks[0, :5] = True
+    masks[1, 5:, 4:] = True
+    boxes = np.zeros((1, nx, ny, nz))
+    boxes[0, 2:6, 3:9, :4] = 0.5
+    regions = blockage.BlockageRenderer(sensors, lights, dim, sigma, projection=masks)
+    scores = regions.render(E)
+    assert scores.shape == (2,)
+    np.testing.assert_allclose(scores, [V[m].sum() for m in masks], rtol=1e-12)
+    regions = blockage.BlockageRenderer(sensors, lights, dim, sigma, projection=boxes,
+                                        dtype=np.float32)
+    np.testing.assert_allclose(regions.render(E), [(V * boxes[0]).sum()], rtol=1e-5)
+    
+    # Batches
+    E_stack = np.stack([E, 2 * E])
+    np.testing.assert_allclose(floor.renderBatch(E_stack), np.stack([V, 2 * V]).sum(axis=3),
+                               rtol=1e-12)
+    out = np.empty((nx, ny), order='F')
+    assert floor.render(E, out=out) is out
+    
+    with pytest.raises(ValueError):
+        blockage.BlockageRenderer(sensors, lights, dim, sigma, projection='ceiling')
+    with pytest.raises(ValueError):
+        blockage.BlockageRenderer(sensors, lights, dim, sigma, projection=np.ones((2, 3, 4)))
+
+def test_hashGaussians_tube_synthetic(synthetic_geometry):
+    sensors, lights, dim, sigma, _ = synthetic_geometry
+    # Add an axis-aligned line and a zero length one
+    sensors = np.vstack([sensors, [2, 3, 1], [4, 4, 4]])
+    lights = np.vstack([lights, [2, 3, 8], [4, 4, 4]])
+    
+    H_dense = blockage.hashGaussians(sensors, lights, dim, sigma / 3)
+    H_tube = blockage.hashGaussians(sensors, lights, dim, sigma / 3, method='tube')
+    np.testing.assert_allclose(H_tube, H_dense, rtol=1e-5, atol=1e-8)
+    
+    # With a cutoff, both engines keep exactly the same weights
+    S_dense = blockage.hashGaussians(sensors, lights, dim, sigma / 3, cutoff=2)
+    S_tube = blockage.hashGaussians(sensors, lights, dim, sigma / 3, cutoff=2, method='tube')
+    assert S_tube.nnz == S_dense.nnz
+    np.testing.assert_allclose(S_tube.toarray(), S_dense.toarray())
+    
+    with pytest.raises(ValueError):
+        blockage.hashGaussians(sensors, lights, dim, sigma, method='fast')
+
+def test_hashGaussians_parallel(synthetic_geometry):
+    sensors, lights, dim, sigma, _ = synthetic_geometry
+    H_serial = blockage.hashGaussians(sensors, lights, dim, sigma)
+    np.testing.assert_array_equal(blockage.hashGaussians(sensors, lights, dim, sigma, n_jobs=3), H_serial)
+    np.testing.assert_array_equal(
+        blockage.hashGaussians(sensors, lights, dim, sigma, n_jobs=4, max_memory=1000), H_serial)
+    
+    S_serial = blockage.hashGaussians(sensors, lights, dim, sigma, cutoff=2)
+    S_parallel = blockage.hashGaussians(sensors, lights, dim, sigma, cutoff=2, n_jobs=-1)
+    np.testing.assert_array_equal(S_parallel.toarray(), S_serial.toarray())
+    
+    T_serial = blockage.hashGaussians(sensors, lights, dim, sigma, method='tube')
+    T_parallel = blockage.hashGaussians(sensors, lights, dim, sigma, method='tube', n_jobs=2)
+    np.testing.assert_array_equal(T_parallel, T_serial)
+
+def test_CoarseToFineRenderer(synthetic_geometry):
+    sensors, lights, dim, sigma, E = synthetic_geometry
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    V_true = blockage.volumeFromHashing(sensors, lights, dim, H, E.flatten('F'))
+    
+    # A zero threshold refines every block down to the exact volume
+    for factors in [(4,), (3,), (4, 2)]:
+        renderer = blockage.CoarseToFineRenderer(sensors, lights, dim, sigma, factors=factors,
+                                                 threshold=0)
+        V, refined = renderer.render(E, return_refined=True)
+        np.testing.assert_allclose(V, V_true, rtol=1e-12, atol=1e-12)
+        assert refined == V_true.size
+    
+    # Only the blocks near the peak are refined, and exactly
+    renderer = blockage.CoarseToFineRenderer(sensors, lights, dim, sigma, factors=(4, 2),
+                                             threshold=0.98, max_memory=2000, n_jobs=2)
+    out = np.empty(tuple(dim), order='F')
+    V, refined = renderer.render(E.flatten('F'), out=out, return_refined=True)
+    assert V is out
+    assert 0 < refined < V_true.size
+    exact = np.isclose(V, V_true, rtol=1e-12, atol=1e-12)
+    assert exact.sum() >= refined
+    
+    # Without a positive peak to be relative to, every voxel is refined
+    V_neg, refined = renderer.render(-E, return_refined=True)
+    assert refined == V_true.size
+    np.testing.assert_allclose(V_neg, -V_true, rtol=1e-12, atol=1e-12)
+    assert exact.flat[np.argmax(V_true)]
+    np.testing.assert_allclose(renderer.renderBatch(E[np.newaxis])[0], V, rtol=1e-12)
+    
+    V32 = blockage.CoarseToFineRenderer(sensors, lights, dim, sigma, threshold=0,
+                                        dtype=np.float32).render(E)
+    assert V32.dtype == np.float32
+    np.testing.assert_allclose(V32, V_true, rtol=1e-5, atol=1e-6)
+    
+    with pytest.raises(ValueError):
+        renderer.render(E, out=np.empty(tuple(dim)))
+    with pytest.raises(ValueError):
+        blockage.CoarseToFineRenderer(sensors, lights, dim, sigma, factors=(4, 3))
+    with pytest.raises(ValueError):
+        blockage.CoarseToFineRenderer(sensors, lights, dim, sigma, factors=(4,), sigmas=(1, 2))
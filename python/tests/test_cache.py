@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from cosbos import blockage, cache
+
+@pytest.fixture
+def synthetic_geometry():
+    rng = np.random.default_rng(0)
+    dim = np.array([6, 7, 5])
+    sensors = rng.uniform(0, 6, size=(2, 3))
+    lights = rng.uniform(0, 6, size=(3, 3))
+    return sensors, lights, dim, 2.0
+
+def test_geometryKey(synthetic_geometry):
+    sensors, lights, dim, sigma = synthetic_geometry
+    key = cache.geometryKey(sensors, lights, dim, sigma)
+    
+    assert key == cache.geometryKey(sensors.copy(), lights.copy(), list(dim), sigma)
+    assert key != cache.geometryKey(sensors, lights, dim, sigma + 1)
+    assert key != cache.geometryKey(sensors, lights, dim, sigma, dtype=np.float32)
+    assert key != cache.geometryKey(sensors, lights, dim, sigma, cutoff=3)
+    assert key != cache.geometryKey(sensors, lights, dim, sigma, method='tube')
+
+def test_HashCache(synthetic_geometry, tmp_path):
+    sensors, lights, dim, sigma = synthetic_geometry
+    H_true = blockage.hashGaussians(sensors, lights, dim, sigma)
+    
+    c = cache.HashCache(cache_dir=str(tmp_path))
+    H_cold = c.get(sensors, lights, dim, sigma)
+    H_warm = c.get(sensors, lights, dim, sigma)
+    assert H_warm is H_cold
+    assert c.stats == {'hits': 1, 'disk_hits': 0, 'misses': 1}
+    
+    # A new process-level cache finds the array on disk
+    c2 = cache.HashCache(cache_dir=str(tmp_path))
+    H_disk = c2.get(sensors, lights, dim, sigma)
+    assert isinstance(H_disk, np.memmap)
+    assert c2.stats == {'hits': 0, 'disk_hits': 1, 'misses': 0}
+    
+    np.testing.assert_array_equal(H_cold, H_true)
+    np.testing.assert_array_equal(H_disk, H_true)
+
+def test_HashCache_lru(synthetic_geometry):
+    sensors, lights, dim, sigma = synthetic_geometry
+    c = cache.HashCache(max_entries=1)
+    c.get(sensors, lights, dim, sigma)
+    c.get(sensors, lights, dim, sigma + 1)
+    c.get(sensors, lights, dim, sigma)
+    assert c.misses == 3
+    
+    H = c.get(sensors, lights, dim, sigma, dtype=np.float32)
+    assert H.dtype == np.float32
+    assert not H.flags.writeable
+
+def test_HashCache_hash_options(synthetic_geometry, tmp_path):
+    sensors, lights, dim, sigma = synthetic_geometry
+    c = cache.HashCache(cache_dir=str(tmp_path))
+    
+    # Memory and parallelism options share the entry of the default H
+    H = c.get(sensors, lights, dim, sigma)
+    assert c.get(sensors, lights, dim, sigma, max_memory=1000, n_jobs=2) is H
+    assert c.stats == {'hits': 1, 'disk_hits': 0, 'misses': 1}
+    
+    S_true = blockage.hashGaussians(sensors, lights, dim, sigma, cutoff=2)
+    S = c.get(sensors, lights, dim, sigma, cutoff=2, method='tube')
+    assert c.misses == 2
+    np.testing.assert_allclose(S.toarray(), S_true.toarray())
+    
+    c2 = cache.HashCache(cache_dir=str(tmp_path))
+    S_disk = c2.get(sensors, lights, dim, sigma, cutoff=2, method='tube')
+    assert c2.stats == {'hits': 0, 'disk_hits': 1, 'misses': 0}
+    assert not S_disk.data.flags.writeable
+    np.testing.assert_array_equal(S_disk.toarray(), S.toarray())
+    
+    c2.clear(disk=True)
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+from cosbos import blockage, classify, io, ltm
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'BlockageModel', 'Data')
+
+@pytest.fixture
+def testbed():
+    dim = (22, 34, 22)
+    sensors, lights, sigma = classify.testbedGeometry(dim)
+    return sensors, lights, dim, sigma
+
+def test_roomRegions(testbed):
+    _, _, dim, _ = testbed
+    regions = classify.roomRegions(dim)
+    assert sorted(regions) == ['U', 'V', 'W', 'X', 'Y', 'Z']
+    # The regions tile the room
+    np.testing.assert_array_equal(sum(mask.astype(int) for mask in regions.values()), 1)
+    assert regions['U'][-1, 0, 0] and regions['Z'][0, -1, 0]
+
+def test_scores_match_rendering(testbed):
+    sensors, lights, dim, sigma = testbed
+    regions = {'U': classify.roomRegions(dim)['U'], 'box': ((2, 9), (3, 20), (0, 10))}
+    classifier = classify.RegionClassifier(sensors, lights, dim, sigma, regions=regions)
+    
+    rng = np.random.default_rng(0)
+    E_stack = rng.uniform(size=(3, 48, 36))
+    renderer = blockage.BlockageRenderer(sensors, lights, dim, sigma)
+    box = classify.boxMask(dim, regions['box'])
+    for E, scores in zip(E_stack, classifier.scores(E_stack)):
+        V = renderer.render(E)
+        np.testing.assert_allclose(scores, [V[regions['U']].mean(), V[box].mean()], rtol=1e-10)
+        np.testing.assert_allclose(classifier.scores(E.flatten('F')), scores, rtol=1e-12)
+
+def test_decide(testbed):
+    sensors, lights, dim, sigma = testbed
+    classifier = classify.RegionClassifier(sensors, lights, dim, sigma, empty_threshold=0.1)
+    names = classifier.names
+    
+    def scores(**values):
+        return np.array([values.get(name, 0.0) for name in names])
+    
+    assert classifier.decide(scores()) == classify.EMPTY
+    assert classifier.decide(scores(U=0.09)) == classify.EMPTY
+    assert classifier.decide(scores(U=1.0, V=0.5, W=0.7)) == 'U'
+    assert classifier.decide(scores(U=1.0, V=0.9)) == 'A'
+    assert classifier.decide(scores(Y=0.85, Z=1.0)) == 'C'
+    assert classifier.decide(np.stack([scores(X=1), scores()])) == ['X', classify.EMPTY]
+    
+    classifier.combination_ratio = None
+    assert classifier.decide(scores(U=1.0, V=0.9)) == 'U'
+    
+    assert classifier.calibrateEmpty(np.zeros((2, 48, 36))) == 0.0
+    assert classifier.classify(np.zeros((48, 36))) == classify.EMPTY
+
+@pytest.mark.skipif(not os.path.isdir(DATA_DIR), reason="BlockageModel/Data not available")
+def test_classify_repo_data(testbed):
+    sensors, lights, dim, sigma = testbed
+    classifier = classify.RegionClassifier(sensors, lights, dim, sigma)
+    A = {}
+    for name in ['0_30876', 'U_85164']:
+        X, Y = io.loadPerturbations(os.path.join(DATA_DIR, name + '.mat'))
+        A[name] = ltm.solve_A_fullrank(X, Y)
+    E = np.maximum(A['0_30876'] - A['U_85164'], 0)
+    assert classifier.classify(E) == 'U'
+    assert classifier.classify(np.zeros_like(E)) == classify.EMPTY
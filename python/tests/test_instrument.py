@@ -0,0 +1,104 @@
+import logging
+import tracemalloc
+
+import numpy as np
+import pytest
+from cosbos import blockage, instrument, ltm, reflection
+
+@pytest.fixture
+def geometry():
+    rng = np.random.default_rng(0)
+    dim = np.array([7, 8, 5])
+    sensors = rng.uniform(0, 6, size=(2, 3))
+    lights = rng.uniform(0, 6, size=(3, 3))
+    E = rng.uniform(size=(4 * 2, 3 * 3))
+    return sensors, lights, dim, 2.0, E
+
+def test_disabled_records_nothing(geometry):
+    sensors, lights, dim, sigma, E = geometry
+    sink = instrument.MemorySink()
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    blockage.volumeFromHashing(sensors, lights, dim, H, E)
+    assert not instrument.isEnabled()
+    assert instrument.stage('anything') is instrument.stage('else')
+    assert sink.stats() == {}
+
+def test_memory_sink_stages(geometry):
+    sensors, lights, dim, sigma, E = geometry
+    with instrument.recording(instrument.MemorySink(keep=10)) as sink:
+        H = blockage.hashGaussians(sensors, lights, dim, sigma)
+        V = blockage.volumeFromHashing(sensors, lights, dim, H, E)
+        blockage.volumeFromHashing(sensors, lights, dim, H, E)
+    assert not instrument.isEnabled()
+
+    stats = sink.stats()
+    assert stats['blockage.hashGaussians']['sizes'] == {'voxels': 7 * 8 * 5, 'lines': 6}
+    assert stats['blockage.volumeFromHashing']['count'] == 2
+    for name in ['lineWeights', 'gemm', 'denominator']:
+        assert stats['blockage.volumeFromHashing.' + name]['count'] == 2
+    assert stats['blockage.volumeFromHashing']['max_allocated_bytes'] is None
+    assert len(sink.records) == 9
+    # Instrumentation does not change results
+    np.testing.assert_array_equal(V, blockage.volumeFromHashing(sensors, lights, dim, H, E))
+
+def test_allocations_nested(geometry):
+    sensors, lights, dim, sigma, _ = geometry
+    with instrument.recording(instrument.MemorySink(), allocations=True) as sink:
+        with instrument.stage('outer'):
+            H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    stats = sink.stats()
+    assert stats['blockage.hashGaussians']['max_allocated_bytes'] >= H.nbytes
+    assert stats['outer']['max_allocated_bytes'] >= stats['blockage.hashGaussians']['max_allocated_bytes']
+
+def test_allocations_keep_caller_tracing(geometry):
+    sensors, lights, dim, sigma, _ = geometry
+    assert not tracemalloc.is_tracing()
+    tracemalloc.start()
+    try:
+        with instrument.recording(instrument.MemorySink(), allocations=True) as sink:
+            blockage.hashGaussians(sensors, lights, dim, sigma)
+        assert sink.stats()['blockage.hashGaussians']['max_allocated_bytes'] > 0
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    
+    # Tracing started by an enclosing session outlives a nested one
+    instrument.enable(instrument.MemorySink(), allocations=True)
+    try:
+        with instrument.recording(instrument.MemorySink(), allocations=True):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        instrument.disable()
+    assert not tracemalloc.is_tracing()
+
+def test_keyword_arguments_and_ltm():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(6, 10))
+    Y = rng.normal(size=(8, 6)) @ X
+    with instrument.recording(instrument.MemorySink()) as sink:
+        reflection.getReflectionKernel(light=[5, 5, 9], sensor=[0, 4, 4], dim=[10, 12, 10], para=1)
+        ltm.solve_A_fullrank(X, Y)
+        ltm.FnormSolver(X).solve(Y)
+    stats = sink.stats()
+    assert stats['reflection.getReflectionKernel']['sizes'] == {'pixels': 120}
+    assert stats['ltm.solve_A_fullrank']['sizes'] == {'m': 6, 'N': 10, 'l': 8}
+    assert stats['ltm.FnormSolver.solve']['count'] == 1
+
+def test_logging_sink(caplog):
+    with caplog.at_level(logging.DEBUG, logger='cosbos.instrument'):
+        with instrument.recording(instrument.LoggingSink()):
+            with instrument.stage('pipeline.frame', frame=3):
+                pass
+    assert 'pipeline.frame' in caplog.text
+    assert 'frame=3' in caplog.text
+
+def test_prometheus_sink():
+    sink = instrument.PrometheusSink()
+    sink.record(instrument.Record('ltm.solve', 0.5, {}, None))
+    sink.record(instrument.Record('ltm.solve', 0.25, {}, 1024))
+    text = sink.exposition()
+    assert '# TYPE cosbos_stage_seconds summary' in text
+    assert 'cosbos_stage_seconds_sum{stage="ltm.solve"} 0.75' in text
+    assert 'cosbos_stage_seconds_count{stage="ltm.solve"} 2' in text
+    assert 'cosbos_stage_allocated_bytes_max{stage="ltm.solve"} 1024' in text
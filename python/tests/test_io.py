@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import scipy.io
+import pytest
+from cosbos import io
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'BlockageModel', 'Data')
+
+@pytest.fixture
+def capture_dir(tmp_path):
+    # Two captures laid out like the files under */Data
+    rng = np.random.default_rng(0)
+    for name in ['0_30876', 'U_85164']:
+        scipy.io.savemat(str(tmp_path / (name + '.mat')), {
+            'TestLight': rng.uniform(size=(5, 6)),
+            'cdata': rng.uniform(size=(5, 8)),
+            'BaseLight': np.full((1, 6), 0.2),
+            'mag': np.array([[0.1]]),
+            'imgs': rng.uniform(size=(4, 16, 16)),
+        })
+    return tmp_path
+
+def test_perturbationPair():
+    TestLight = np.arange(12.0).reshape(3, 4)
+    cdata = np.arange(6.0).reshape(3, 2) ** 2
+    X, Y = io.perturbationPair({'TestLight': TestLight, 'cdata': cdata})
+    np.testing.assert_array_equal(X, (TestLight[1:] - TestLight[0]).T)
+    np.testing.assert_array_equal(Y, (cdata[1:] - cdata[0]).T)
+
+def test_loadCapture_skips_images(capture_dir):
+    data = io.loadCapture(str(capture_dir / '0_30876.mat'))
+    assert sorted(data) == sorted(io.SENSING_VARIABLES)
+    assert data['TestLight'].shape == (5, 6)
+
+    with pytest.raises(KeyError):
+        io.loadCapture(str(capture_dir / '0_30876.mat'), variables=['TestLight', 'nope'])
+
+def test_loadPerturbations_cache(capture_dir, tmp_path):
+    path = str(capture_dir / 'U_85164.mat')
+    data = scipy.io.loadmat(path)
+    X_expected, Y_expected = io.perturbationPair(data)
+
+    cache_dir = str(tmp_path / 'cache')
+    for _ in range(2):
+        X, Y = io.loadPerturbations(path, cache_dir=cache_dir)
+        np.testing.assert_array_equal(X, X_expected)
+        np.testing.assert_array_equal(Y, Y_expected)
+    assert len(os.listdir(cache_dir)) == 1
+    with np.load(os.path.join(cache_dir, os.listdir(cache_dir)[0])) as cached:
+        assert sorted(cached.files) == ['X', 'Y']
+
+def test_iterScenarios(capture_dir):
+    labels = [label for label, X, Y in io.iterScenarios(str(capture_dir))]
+    assert labels == ['0', 'U']
+
+@pytest.mark.skipif(not os.path.isdir(DATA_DIR), reason="BlockageModel/Data not available")
+def test_iterScenarios_repo_data():
+    for label, X, Y in io.iterScenarios(DATA_DIR):
+        assert X.shape == (36, 40)
+        assert Y.shape == (48, 40)
+
+@pytest.fixture
+def volumes():
+    rng = np.random.default_rng(1)
+    return [rng.uniform(0, 3, size=(6, 7, 4)) for _ in range(5)]
+
+def test_quantizeVolume(volumes):
+    V = volumes[0]
+    for dtype in [np.uint8, np.uint16]:
+        Q, value_range = io.quantizeVolume(V, dtype)
+        assert Q.dtype == dtype
+        assert Q.min() == 0 and Q.max() == np.iinfo(dtype).max
+        step = (V.max() - V.min()) / np.iinfo(dtype).max
+        np.testing.assert_allclose(io.dequantizeVolume(Q, value_range), V, atol=step)
+    
+    # A constant volume maps to zeros
+    Q, _ = io.quantizeVolume(np.ones((2, 2, 2)))
+    assert not Q.any()
+
+@pytest.mark.parametrize("dtype,compress", [(np.uint8, True), (np.uint16, False)])
+def test_TiffVolumeWriter(tmp_path, volumes, dtype, compress):
+    path = str(tmp_path / 'volumes.tif')
+    with io.TiffVolumeWriter(path, dtype=dtype, compress=compress) as writer:
+        for V in volumes:
+            writer.append(V)
+    
+    pages, descriptions = io.readTiff(path)
+    assert pages.shape == (6, 7, 4 * len(volumes))
+    for t, V in enumerate(volumes):
+        Q, (vmin, vmax) = io.quantizeVolume(V, dtype)
+        np.testing.assert_array_equal(pages[:, :, 4 * t:4 * (t + 1)], Q)
+        assert descriptions[4 * t] == 'cosbos frame=%d vmin=%r vmax=%r' % (t, vmin, vmax)
+        assert descriptions[4 * t + 1] is None
+
+def test_writeTiff(tmp_path, volumes):
+    path = str(tmp_path / 'volume.tif')
+    io.writeTiff(volumes[0], path)
+    pages, _ = io.readTiff(path)
+    np.testing.assert_array_equal(pages, io.quantizeVolume(volumes[0])[0])
+
+def test_ChunkedVolumeStore(tmp_path, volumes):
+    directory = str(tmp_path / 'store')
+    with io.ChunkedVolumeStore(directory, frames_per_chunk=2) as store:
+        for V in volumes[:3]:
+            store.append(V)
+        # Readable before close, across the chunk boundary
+        assert store.read(0, 3).shape == (3, 6, 7, 4)
+    
+    # Reopening appends
+    with io.ChunkedVolumeStore(directory) as store:
+        for V in volumes[3:]:
+            store.append(V)
+    
+    store = io.ChunkedVolumeStore(directory)
+    assert len(store) == 5
+    frames = store.read(2, 4)
+    assert isinstance(frames, np.memmap)
+    for k, t in enumerate(range(2, 4)):
+        np.testing.assert_array_equal(frames[k], io.quantizeVolume(volumes[t])[0])
+    
+    V = store.read(1, 5, dequantize=True)
+    for k in range(4):
+        np.testing.assert_allclose(V[k], volumes[k + 1], atol=3.0 / 255)
+    with pytest.raises(IndexError):
+        store.read(4, 6)
+    
+    # An existing store keeps its dtype
+    assert io.ChunkedVolumeStore(directory, dtype=np.uint8).dtype == np.uint8
+    with pytest.raises(ValueError, match="uint8"):
+        io.ChunkedVolumeStore(directory, dtype=np.float32)
+
+def test_BackgroundWriter(tmp_path, volumes):
+    directory = str(tmp_path / 'store')
+    buffer = np.empty_like(volumes[0])
+    with io.BackgroundWriter(io.ChunkedVolumeStore(directory, dtype=np.float32), max_pending=2) as writer:
+        for V in volumes:
+            # The caller reuses its buffer, as with double-buffered rendering
+            buffer[...] = V
+            writer.append(buffer)
+    
+    frames = io.ChunkedVolumeStore(directory).read(0, len(volumes))
+    np.testing.assert_allclose(frames, np.stack(volumes), rtol=1e-6)
+
+def test_ChunkedVolumeStore_read_while_writing(tmp_path, volumes):
+    # One chunk per frame, so reads race with chunk switches and closes
+    store = io.ChunkedVolumeStore(str(tmp_path / 'store'), dtype=np.float32, frames_per_chunk=1)
+    frames = [volumes[t % len(volumes)] * (t + 1) for t in range(200)]
+    
+    with io.BackgroundWriter(store, max_pending=2) as writer:
+        for t, V in enumerate(frames):
+            writer.append(V)
+            n = len(store)
+            if n:
+                np.testing.assert_allclose(store.read(n - 1)[0], frames[n - 1], rtol=1e-6)
+    np.testing.assert_allclose(store.read(0, len(frames)), np.stack(frames), rtol=1e-6)
+
+def test_BackgroundWriter_errors(tmp_path, volumes):
+    writer = io.BackgroundWriter(io.ChunkedVolumeStore(str(tmp_path / 'store')))
+    writer.append(volumes[0])
+    writer.append(np.zeros((2, 2, 2)))
+    with pytest.raises(ValueError, match="does not match"):
+        writer.close()
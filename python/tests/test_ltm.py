@@ -1,3 +1,5 @@
+import concurrent.futures
+
 import numpy as np
 import scipy.io
 import os
@@ -67,3 +69,162 @@ def test_solve_A_1norm(ground_truth):
     A_pred = ltm.solve_A_1norm(X, Y)
     Y_pred = A_pred @ X
     np.testing.assert_allclose(Y_pred, Y, rtol=1e-3, atol=1e-3)
+
+@pytest.fixture
+def synthetic_ltm():
+    # Sparse A, overdetermined (N > m) so that A is recoverable
+    rng = np.random.default_rng(0)
+    l, m, N = 8, 6, 10
+    A_true = rng.normal(size=(l, m)) * (rng.uniform(size=(l, m)) < 0.4)
+    X = rng.normal(size=(m, N))
+    return X, A_true @ X, A_true
+
+def test_solve_A_0norm_synthetic(synthetic_ltm):
+    X, Y, A_true = synthetic_ltm
+    A_pred = ltm.solve_A_0norm(X, Y)
+    np.testing.assert_allclose(A_pred, A_true, atol=1e-8)
+
+def test_solve_A_1norm_kronecker(synthetic_ltm):
+    import cvxpy as cp
+    X, Y, _ = synthetic_ltm
+    # Drop samples so the program is underdetermined
+    X, Y = X[:, :4], Y[:, :4]
+    l, m = Y.shape[0], X.shape[0]
+    
+    # Kronecker formulation of solve_A_1norm.m
+    a_vec = cp.Variable(m * l)
+    cp.Problem(cp.Minimize(cp.norm(a_vec, 1)),
+               [np.kron(X.T, np.eye(l)) @ a_vec == Y.flatten(order='F')]).solve()
+    A_kron = a_vec.value.reshape((l, m), order='F')
+    
+    A_pred = ltm.solve_A_1norm(X, Y)
+    np.testing.assert_allclose(A_pred @ X, Y, atol=1e-6)
+    np.testing.assert_allclose(np.abs(A_pred).sum(), np.abs(A_kron).sum(), rtol=1e-4)
+
+def test_solve_A_rowwise_parallel(synthetic_ltm):
+    X, Y, A_true = synthetic_ltm
+    
+    A_pred, info = ltm.solve_A_0norm(X, Y, n_jobs=2, return_info=True)
+    np.testing.assert_allclose(A_pred, A_true, atol=1e-8)
+    assert [row['row'] for row in info] == list(range(Y.shape[0]))
+    assert all(row['converged'] and row['time'] >= 0 for row in info)
+    assert [row['nnz'] for row in info] == list(np.count_nonzero(A_true, axis=1))
+    
+    A_serial = ltm.solve_A_1norm(X, Y)
+    A_pred, info = ltm.solve_A_1norm(X, Y, n_jobs=2, return_info=True)
+    np.testing.assert_allclose(A_pred, A_serial, atol=1e-6)
+    assert all(row['status'] == 'optimal' for row in info)
+
+def test_solve_A_0norm_threads():
+    # Concurrent serial row-wise solves of different problems
+    rng = np.random.default_rng(1)
+    problems = []
+    for _ in range(4):
+        A_true = rng.normal(size=(8, 6)) * (rng.uniform(size=(8, 6)) < 0.4)
+        X = rng.normal(size=(6, 10))
+        problems.append((X, A_true @ X, A_true))
+    
+    def solve(problem):
+        X, Y, A_true = problem
+        for _ in range(5):
+            A_pred, info = ltm.solve_A_0norm(X, Y, return_info=True)
+            np.testing.assert_allclose(A_pred, A_true, atol=1e-8)
+        return True
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(solve, problems))
+
+def test_StreamingLTM():
+    rng = np.random.default_rng(0)
+    l, m, N = 8, 6, 30
+    A_true = rng.normal(size=(l, m))
+    X = rng.normal(size=(m, N))
+    Y = A_true @ X + 0.01 * rng.normal(size=(l, N))
+    
+    stream = ltm.StreamingLTM(m, l, regularization=1e-8)
+    for k in range(N):
+        stream.update(X[:, k], Y[:, k])
+    assert stream.n_updates == N
+    np.testing.assert_allclose(stream.A, ltm.solve_A_fullrank(X, Y), atol=1e-6)
+    
+    # Streaming updates after a batch fit match the batch fit over all pairs
+    for forgetting in [1.0, 0.9]:
+        batch = ltm.StreamingLTM(m, l, forgetting=forgetting).fit(X, Y)
+        stream = ltm.StreamingLTM(m, l, forgetting=forgetting).fit(X[:, :10], Y[:, :10])
+        stream.updateBatch(X[:, 10:], Y[:, 10:])
+        np.testing.assert_allclose(stream.A, batch.A, atol=1e-9)
+
+def test_StreamingLTM_tracking():
+    rng = np.random.default_rng(1)
+    l, m = 8, 6
+    A_old, A_new = rng.normal(size=(l, m)), rng.normal(size=(l, m))
+    
+    stream = ltm.StreamingLTM(m, l, forgetting=0.8)
+    for A in [A_old, A_new]:
+        for _ in range(100):
+            x = rng.normal(size=m)
+            stream.update(x, A @ x)
+    np.testing.assert_allclose(stream.A, A_new, atol=1e-6)
+
+def test_solve_A_batch():
+    rng = np.random.default_rng(0)
+    Xs = rng.normal(size=(5, 6, 10))
+    Ys = rng.normal(size=(5, 8, 6)) @ Xs
+    
+    As = ltm.solve_A_fullrank_batch(Xs, Ys)
+    assert As.shape == (5, 8, 6)
+    As_F = ltm.solve_A_Fnorm_batch(Xs, Ys)
+    for X, Y, A, A_F in zip(Xs, Ys, As, As_F):
+        np.testing.assert_allclose(A, ltm.solve_A_fullrank(X, Y), atol=1e-10)
+        np.testing.assert_allclose(A_F, ltm.solve_A_Fnorm(X, Y), atol=1e-10)
+    
+    # Rooms of different sizes are grouped by shape
+    Xs_mixed = [Xs[0], rng.normal(size=(4, 7)), Xs[1]]
+    Ys_mixed = [Ys[0], rng.normal(size=(3, 7)), Ys[1]]
+    As_mixed = ltm.solve_A_Fnorm_batch(Xs_mixed, Ys_mixed)
+    assert [A.shape for A in As_mixed] == [(8, 6), (3, 4), (8, 6)]
+    for X, Y, A in zip(Xs_mixed, Ys_mixed, As_mixed):
+        np.testing.assert_allclose(A, ltm.solve_A_Fnorm(X, Y), atol=1e-10)
+
+def test_FnormSolver():
+    rng = np.random.default_rng(0)
+    # Rank 3 design with 6 channels
+    X = rng.normal(size=(6, 3)) @ rng.normal(size=(3, 10))
+    solver = ltm.FnormSolver(X)
+    assert solver.rank == 3
+    assert solver.pinv.shape == (10, 6)
+    np.testing.assert_allclose(solver.pinv, np.linalg.pinv(X), atol=1e-10)
+    
+    for _ in range(3):
+        Y = rng.normal(size=(8, 10))
+        np.testing.assert_allclose(solver.solve(Y), ltm.solve_A_Fnorm(X, Y), atol=1e-12)
+    
+    # A larger threshold drops more singular values
+    s_vals = np.linalg.svd(X, compute_uv=False)
+    assert ltm.FnormSolver(X, threshold=(s_vals[0] + s_vals[1]) / 2).rank == 1
+
+def test_BasisPursuitSolver(synthetic_ltm):
+    X, Y, _ = synthetic_ltm
+    X = X[:, :4]
+    rng = np.random.default_rng(1)
+    
+    bp = ltm.BasisPursuitSolver(X, Y.shape[0], solver='CLARABEL', tol=1e-9)
+    for _ in range(3):
+        Y_epoch = rng.normal(size=(Y.shape[0], X.shape[0])) @ X
+        A = bp.solve(Y_epoch)
+        np.testing.assert_allclose(A @ X, Y_epoch, atol=1e-6)
+        np.testing.assert_allclose(A, ltm.solve_A_1norm(X, Y_epoch), atol=1e-5)
+    
+    assert bp.n_solves == 3
+    assert bp.status == 'optimal'
+    assert bp.setup_time >= 0 and bp.solve_time >= 0
+    
+    # A new X reuses the compiled program
+    X_new = rng.normal(size=X.shape)
+    A = bp.solve(Y_epoch, X=X_new)
+    np.testing.assert_allclose(A @ X_new, Y_epoch, atol=1e-6)
+    
+    with pytest.raises(ValueError):
+        ltm.BasisPursuitSolver(X, 2, solver='NOT_A_SOLVER')
+    with pytest.raises(ValueError):
+        ltm.BasisPursuitSolver(X, 2, tol=1e-6)
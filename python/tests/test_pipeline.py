@@ -0,0 +1,89 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from cosbos import blockage, ltm, pipeline
+
+@pytest.fixture
+def synthetic_stream():
+    # Small room and a few frames of noiseless measurements Y = A X
+    rng = np.random.default_rng(0)
+    dim = np.array([7, 8, 5])
+    sensors = rng.uniform(0, 6, size=(2, 3))
+    lights = rng.uniform(0, 6, size=(3, 3))
+    m, l, N = 4 * 2, 3 * 3, 12
+
+    def frame(A):
+        TestLight = rng.uniform(size=(N + 1, l))
+        cdata = (A @ TestLight.T).T
+        return TestLight, cdata
+
+    A0 = rng.uniform(1, 2, size=(m, l))
+    base_frame = frame(A0)
+    frames = [frame(A0 - rng.uniform(0, 0.5, size=(m, l))) for _ in range(4)]
+    return sensors, lights, dim, 2.0, base_frame, frames
+
+def reference_volumes(sensors, lights, dim, sigma, base_frame, frames):
+    # The demo_Blockage flow, frame by frame
+    H = blockage.hashGaussians(sensors, lights, dim, sigma)
+    X0, Y0 = pipeline.perturbationPair(base_frame)
+    A0 = ltm.solve_A_fullrank(X0, Y0)
+    volumes = []
+    for frame in frames:
+        X, Y = pipeline.perturbationPair(frame)
+        E = A0 - ltm.solve_A_fullrank(X, Y)
+        E[E < 0] = 0
+        volumes.append(blockage.volumeFromHashing(sensors, lights, dim, H, E))
+    return volumes
+
+@pytest.mark.parametrize("prefetch_depth,double_buffer", [(0, False), (2, False), (2, True)])
+def test_occupancyPipeline(synthetic_stream, prefetch_depth, double_buffer):
+    sensors, lights, dim, sigma, base_frame, frames = synthetic_stream
+    expected = reference_volumes(sensors, lights, dim, sigma, base_frame, frames)
+
+    volumes = pipeline.occupancyPipeline(iter(frames), base_frame, sensors, lights, dim, sigma,
+                                         prefetch_depth=prefetch_depth, double_buffer=double_buffer)
+    count = 0
+    for V, V_expected in zip(volumes, expected):
+        np.testing.assert_allclose(V, V_expected, rtol=1e-10, atol=1e-12)
+        count += 1
+    assert count == len(frames)
+
+def test_prefetch_propagates_errors():
+    def failing():
+        yield 1
+        raise RuntimeError("sensor disconnected")
+
+    items = pipeline.prefetch(failing(), depth=2)
+    assert next(items) == 1
+    with pytest.raises(RuntimeError, match="sensor disconnected"):
+        next(items)
+
+def test_prefetch_early_exit():
+    items = pipeline.prefetch(iter(range(1000)), depth=2)
+    assert [next(items) for _ in range(3)] == [0, 1, 2]
+    items.close()
+
+def _prefetchThreads():
+    return [thread for thread in threading.enumerate() if thread.name == 'cosbos-prefetch']
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_prefetch_early_exit_full_queue(fail):
+    # The producer reaches the end (or fails) while the queue is full and
+    # the consumer has already stopped; it must still exit
+    def upstream():
+        yield from range(2)
+        if fail:
+            raise RuntimeError("sensor disconnected")
+
+    before = set(_prefetchThreads())
+    items = pipeline.prefetch(upstream(), depth=1)
+    assert next(items) == 0
+    threads = [thread for thread in _prefetchThreads() if thread not in before]
+    assert threads
+    time.sleep(0.3)  # let the producer queue 1 and reach the end
+    items.close()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
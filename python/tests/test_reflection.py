@@ -28,3 +28,115 @@ def test_getReflectionKernel(ground_truth):
     
     # Verify
     np.testing.assert_allclose(K_pred, K_true, rtol=1e-5, atol=1e-8)
+
+def test_getReflectionKernels():
+    lights = np.array([[75, 22.5, 86.4], [12, 94.5, 86.4]])
+    sensors = np.array([[66, 22, 86.4], [19.5, 95, 86.4], [32.5, 106.5, 86.4]])
+    dim = [30, 40, 88]
+    
+    for para in [0, 1]:
+        K = reflection.getReflectionKernels(lights, sensors, dim, para)
+        assert K.shape == (3, 2, 30, 40)
+        for s in range(3):
+            for l in range(2):
+                K_pair = reflection.getReflectionKernel(lights[l], sensors[s], dim, para)
+                np.testing.assert_allclose(K[s, l], K_pair, rtol=1e-12)
+        
+        # Chunked float32 mode
+        K32 = reflection.getReflectionKernels(lights, sensors, dim, para, dtype=np.float32, chunk_size=7)
+        assert K32.dtype == np.float32
+        np.testing.assert_allclose(K32, K, rtol=1e-6)
+
+def test_FixtureProfile():
+    vivia = reflection.getFixtureProfile('vivia_7dr3_rgb')
+    theta = np.linspace(0, np.pi / 2, 1001)
+    
+    np.testing.assert_allclose(vivia.exact(theta), reflection.lightDistribution(theta))
+    np.testing.assert_allclose(vivia(theta), vivia.exact(theta), atol=vivia.maxError())
+    assert vivia.maxError() < 0.01
+    
+    # Finer tables are more accurate
+    fine = reflection.FixtureProfile(vivia.angles, vivia.intensity, resolution=0.01)
+    assert fine.maxError() < vivia.maxError()
+    assert np.ndim(vivia(0.3)) == 0
+
+def test_FixtureProfile_uneven_range():
+    # The range is not a multiple of the resolution; the table of a linear
+    # profile must still be exact up to the last cell
+    profile = reflection.FixtureProfile([0, 1, 2.12], [0, 1, 2.12], resolution=0.05)
+    theta = np.linspace(0, 2.12, 1001) * np.pi / 180
+    np.testing.assert_allclose(profile(theta), profile.exact(theta), atol=1e-12)
+    assert profile.maxError() < 1e-12
+
+@pytest.fixture
+def flat_profile():
+    # A flat fixture, registered for one test only
+    reflection.registerFixtureProfile('flat', reflection.FixtureProfile([0, 90], [2, 2]))
+    yield 'flat'
+    reflection.unregisterFixtureProfile('flat')
+
+def test_registerFixtureProfile(flat_profile):
+    # A flat fixture cancels the intensity factor of the kernel
+    light = [10, 12, 86.4]
+    sensor = [20, 5, 86.4]
+    dim = [30, 40, 88]
+    
+    K_flat = reflection.getReflectionKernel(light, sensor, dim, 1, profile=flat_profile)
+    K_flat_all = reflection.getReflectionKernels([light], [sensor], dim, 1, profile=flat_profile)
+    np.testing.assert_allclose(K_flat_all[0, 0], K_flat, rtol=1e-12)
+    
+    K_vivia = reflection.getReflectionKernel(light, sensor, dim, 1)
+    Iq = reflection.lightDistribution(np.arccos(
+        86.4 / np.sqrt((10 - np.arange(1, 31)[:, None])**2 + (12 - np.arange(1, 41))**2 + 86.4**2)))
+    np.testing.assert_allclose(K_flat * Iq / 2, K_vivia, rtol=1e-10)
+    
+    with pytest.raises(KeyError):
+        reflection.getFixtureProfile('unknown')
+    with pytest.raises(KeyError):
+        reflection.unregisterFixtureProfile('unknown')
+
+def test_floorFromReflection():
+    rng = np.random.default_rng(0)
+    lights = np.array([[75, 22.5, 86.4], [12, 94.5, 86.4]])
+    sensors = np.array([[66, 22, 86.4], [19.5, 95, 86.4], [32.5, 106.5, 86.4]])
+    K = reflection.getReflectionKernels(lights, sensors, [30, 40, 88], 1)
+    E = rng.uniform(size=(4, 4 * 3, 3 * 2))
+    
+    for lambda1, lambda2 in [(1, 1), (2, 0.5)]:
+        C = reflection.floorFromReflection(E, K, lambda1, lambda2)
+        assert C.shape == (4, 30, 40)
+        
+        # Loop of demo_Reflection.m
+        for t in range(4):
+            C_true = np.zeros((30, 40))
+            for s in range(3):
+                for l in range(2):
+                    a = E[t, 4 * s, 3 * l] + E[t, 4 * s + 1, 3 * l + 1] + E[t, 4 * s + 2, 3 * l + 2]
+                    C_true += a ** lambda1 * K[s, l]
+            C_true /= K.sum(axis=(0, 1)) ** lambda2
+            np.testing.assert_allclose(C[t], C_true, rtol=1e-12)
+            np.testing.assert_allclose(
+                reflection.floorFromReflection(E[t].flatten('F'), K, lambda1, lambda2), C_true, rtol=1e-12)
+        
+        C_sum = reflection.floorFromReflection(E, K, lambda1, lambda2, kernel_sum=K.sum(axis=(0, 1)))
+        np.testing.assert_allclose(C_sum, C, rtol=1e-12)
+    
+    # Kernels changed in place are normalized by their new sum
+    K[0, 0] *= 3
+    C_new = reflection.floorFromReflection(E, K)
+    np.testing.assert_array_equal(C_new, reflection.floorFromReflection(E, K.copy()))
+
+def test_vivia_independent_of_registry():
+    # The default kernels do not depend on the registry entry of the Vivia
+    vivia = reflection.getFixtureProfile('vivia_7dr3_rgb')
+    theta = np.linspace(0, np.pi / 2, 101)
+    Iq = reflection.lightDistribution(theta)
+    K = reflection.getReflectionKernel([10, 12, 86.4], [20, 5, 86.4], [30, 40, 88], 1)
+    try:
+        reflection.unregisterFixtureProfile('vivia_7dr3_rgb')
+        np.testing.assert_array_equal(reflection.lightDistribution(theta), Iq)
+        reflection.registerFixtureProfile('vivia_7dr3_rgb', reflection.FixtureProfile([0, 90], [1, 1]))
+        np.testing.assert_array_equal(
+            reflection.getReflectionKernel([10, 12, 86.4], [20, 5, 86.4], [30, 40, 88], 1), K)
+    finally:
+        reflection.registerFixtureProfile('vivia_7dr3_rgb', vivia)